@@ -0,0 +1,307 @@
+import argparse
+import csv
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from database import StudentDatabase
+from event_log import EVENT_DTYPE, AttendanceEventLog
+
+ATTENDANCE_COLUMNS = ['id', 'student_id', 'name', 'enrollment_number', 'timestamp']
+DAILY_COLUMNS = ['student_id', 'camera_id', 'day', 'first_seen', 'last_seen', 'hits', 'best_score']
+
+
+class _TooManyRestarts(Exception):
+    """Raised from the progress callback to abort an incremental backup"""
+
+
+class DatabaseBackup:
+    """Online snapshots, restore, verification and attendance archival for the student database.
+
+    Snapshots and restores use SQLite's incremental backup API: pages are
+    copied a few at a time and the progress callback sleeps between steps,
+    while the source lock is released, so mark_attendance is never held up
+    for long. Attendance event segments are copied alongside the database
+    into a <snapshot>_events directory.
+    """
+
+    def __init__(self, db_path="student_database.db", backup_dir="backups", archive_dir="archives",
+                 pages=64, sleep=0.005, max_restarts=3, events_dir="attendance_events"):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.archive_dir = archive_dir
+        self.events_dir = events_dir
+        # Pages copied per step and pause between steps
+        self.pages = pages
+        self.sleep = sleep
+        # Writes from other connections restart an incremental backup; after
+        # this many restarts it is aborted and the database copied in one step
+        self.max_restarts = max_restarts
+
+    def _copy(self, source_path, target_path):
+        """Incrementally copy one database into another, returning step statistics"""
+        stats = {'steps': 0, 'restarts': 0, 'pages': 0, 'single_step': False}
+        last_remaining = [None]
+
+        def progress(status, remaining, total):
+            stats['steps'] += 1
+            stats['pages'] = total
+            if last_remaining[0] is not None and remaining > last_remaining[0]:
+                stats['restarts'] += 1
+                if stats['restarts'] > self.max_restarts:
+                    raise _TooManyRestarts()
+            last_remaining[0] = remaining
+            if remaining:
+                # backup() only sleeps on BUSY/LOCKED; pausing here lets
+                # writers in between steps
+                time.sleep(self.sleep)
+
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            try:
+                source.backup(target, pages=self.pages, progress=progress)
+            except _TooManyRestarts:
+                # Live writes keep invalidating the copy: take it in one step,
+                # holding the read lock for a single full pass
+                stats['single_step'] = True
+                source.backup(target, pages=-1)
+        finally:
+            target.close()
+            source.close()
+        return stats
+
+    @staticmethod
+    def events_path(path):
+        """Directory holding the event segments of a snapshot"""
+        return f"{os.path.splitext(path)[0]}_events"
+
+    @staticmethod
+    def _copy_segments(source_dir, target_dir):
+        """Copy every event segment, up to its last complete record"""
+        os.makedirs(target_dir, exist_ok=True)
+        copied = 0
+        for _, path in AttendanceEventLog(source_dir).segments():
+            # The live segment may end in a half-written record; appends after
+            # it would misalign every later record
+            size = os.path.getsize(path) // EVENT_DTYPE.itemsize * EVENT_DTYPE.itemsize
+            with open(path, 'rb') as source, open(os.path.join(target_dir, os.path.basename(path)), 'wb') as target:
+                shutil.copyfileobj(source, target)
+                target.truncate(size)
+            copied += 1
+        return copied
+
+    def snapshot(self, path=None):
+        """Write an online snapshot of the database and its event segments and report how long it took"""
+        if path is None:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            path = os.path.join(self.backup_dir, f"student_database_{timestamp}.db")
+
+        start = time.perf_counter()
+        # Segments first: a segment compacted in between is then in both
+        # copies rather than in neither
+        segments = self._copy_segments(self.events_dir, self.events_path(path))
+        stats = self._copy(self.db_path, path)
+        stats['path'] = path
+        stats['segments'] = segments
+        stats['seconds'] = time.perf_counter() - start
+        stats['bytes'] = os.path.getsize(path)
+        return stats
+
+    def verify(self, path):
+        """Integrity check, row counts and a checksum of the students table"""
+        start = time.perf_counter()
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        cursor = conn.cursor()
+
+        cursor.execute('PRAGMA integrity_check')
+        integrity = cursor.fetchone()[0]
+
+        counts = {}
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+        for (table,) in cursor.fetchall():
+            cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+            counts[table] = cursor.fetchone()[0]
+
+        digest = hashlib.sha256()
+        cursor.execute('SELECT id, name, enrollment_number, face_encoding FROM students ORDER BY id')
+        for row in cursor:
+            digest.update(repr(row).encode('utf-8'))
+        conn.close()
+
+        return {
+            'path': path,
+            'ok': integrity == 'ok',
+            'integrity': integrity,
+            'counts': counts,
+            'students_checksum': digest.hexdigest(),
+            'seconds': time.perf_counter() - start
+        }
+
+    def restore(self, path):
+        """Verify a snapshot and copy it and its event segments over the live data.
+
+        Snapshots taken without an events directory leave the live segments
+        untouched.
+        """
+        verification = self.verify(path)
+        if not verification['ok']:
+            raise ValueError(f"Snapshot {path} failed integrity check: {verification['integrity']}")
+
+        start = time.perf_counter()
+        stats = self._copy(path, self.db_path)
+        stats['segments'] = None
+        if os.path.isdir(self.events_path(path)):
+            AttendanceEventLog.shared(self.events_dir).clear()
+            stats['segments'] = self._copy_segments(self.events_path(path), self.events_dir)
+        stats['path'] = path
+        stats['seconds'] = time.perf_counter() - start
+        stats['verify_seconds'] = verification['seconds']
+        return stats
+
+    def _write_archive(self, prefix, first, last, columns, cursor, chunk_size):
+        """Stream a query into a new gzip CSV, read it back and return (path, rows)"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        base = os.path.join(self.archive_dir,
+                            f"{prefix}_{first[:10].replace('-', '')}_{last[:10].replace('-', '')}")
+        path = f"{base}.csv.gz"
+        suffix = 1
+        while os.path.exists(path):
+            path = f"{base}_{suffix}.csv.gz"
+            suffix += 1
+
+        archived = []
+        with gzip.open(path, 'wt', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                archived.extend(rows)
+
+        # Read the archive back before anything is deleted
+        with gzip.open(path, 'rt', newline='') as f:
+            written = sum(1 for _ in csv.reader(f)) - 1
+        if written != len(archived):
+            raise IOError(f"Archive {path} has {written} rows, expected {len(archived)}")
+        return path, archived
+
+    def archive_attendance(self, older_than_days=90, chunk_size=5000):
+        """Move attendance rows and daily aggregates older than the cutoff into compressed CSV archives.
+
+        Sealed event segments are compacted first, so old events end up in
+        attendance_daily and are archived with it. Rows are only deleted
+        after their archive has been written and read back, and attendance
+        deletes run in small transactions so live marking is not blocked.
+        """
+        start = time.perf_counter()
+        compacted = StudentDatabase(self.db_path, self.events_dir).compact_events()
+        # Attendance timestamps use SQLite's CURRENT_TIMESTAMP (UTC), daily
+        # aggregates UTC days
+        cutoff_time = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+        cutoff = cutoff_time.strftime("%Y-%m-%d %H:%M:%S")
+        cutoff_day = cutoff_time.strftime("%Y%m%d")
+        result = {'compacted': compacted, 'archived': 0, 'path': None, 'daily_archived': 0, 'daily_path': None}
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT MIN(timestamp), MAX(timestamp), COUNT(*) FROM attendance WHERE timestamp < ?',
+                           (cutoff,))
+            first, last, count = cursor.fetchone()
+            if count:
+                cursor.execute('SELECT * FROM attendance WHERE timestamp < ? ORDER BY id', (cutoff,))
+                path, rows = self._write_archive('attendance', first, last, ATTENDANCE_COLUMNS, cursor, chunk_size)
+                archived_ids = [row[0] for row in rows]
+
+                # Ids are ascending and new rows only get larger ids, so each id
+                # range plus the cutoff matches exactly the archived rows
+                for offset in range(0, len(archived_ids), chunk_size):
+                    chunk = archived_ids[offset:offset + chunk_size]
+                    cursor.execute('DELETE FROM attendance WHERE id BETWEEN ? AND ? AND timestamp < ?',
+                                   (chunk[0], chunk[-1], cutoff))
+                    conn.commit()
+                result['archived'] = len(archived_ids)
+                result['path'] = path
+
+            cursor.execute('SELECT MIN(day), MAX(day), COUNT(*) FROM attendance_daily WHERE day < ?', (cutoff_day,))
+            first, last, count = cursor.fetchone()
+            if count:
+                cursor.execute(f'SELECT {", ".join(DAILY_COLUMNS)} FROM attendance_daily WHERE day < ? '
+                               'ORDER BY day, student_id, camera_id', (cutoff_day,))
+                path, rows = self._write_archive('attendance_daily', first, last, DAILY_COLUMNS, cursor, chunk_size)
+                # One row per student, camera and day, so a single delete is short
+                cursor.execute('DELETE FROM attendance_daily WHERE day < ?', (cutoff_day,))
+                conn.commit()
+                result['daily_archived'] = len(rows)
+                result['daily_path'] = path
+        finally:
+            conn.close()
+
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backup, restore and archive the student database")
+    parser.add_argument('--db', default="student_database.db")
+    parser.add_argument('--events-dir', default="attendance_events")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    snapshot_parser = subparsers.add_parser('snapshot', help="Online snapshot of the live database")
+    snapshot_parser.add_argument('path', nargs='?')
+
+    restore_parser = subparsers.add_parser('restore', help="Verify a snapshot and restore it")
+    restore_parser.add_argument('path')
+
+    verify_parser = subparsers.add_parser('verify', help="Check a snapshot or database file")
+    verify_parser.add_argument('path')
+
+    archive_parser = subparsers.add_parser('archive', help="Move old attendance into compressed archives")
+    archive_parser.add_argument('--days', type=int, default=90)
+
+    args = parser.parse_args()
+    backup = DatabaseBackup(args.db, events_dir=args.events_dir)
+
+    if args.command == 'snapshot':
+        stats = backup.snapshot(args.path)
+        print(f"Snapshot written to {stats['path']}: {stats['pages']} pages, {stats['bytes']} bytes, "
+              f"{stats['segments']} event segments in {stats['steps']} steps ({stats['restarts']} restarts), "
+              f"{stats['seconds']:.2f}s")
+        if stats['single_step']:
+            print("Live writes kept restarting the copy; it was finished in a single step")
+    elif args.command == 'restore':
+        stats = backup.restore(args.path)
+        print(f"Restored {stats['path']}: verified in {stats['verify_seconds']:.2f}s, "
+              f"copied {stats['pages']} pages in {stats['seconds']:.2f}s")
+        if stats['segments'] is None:
+            print("Snapshot has no event segments; live segments were left in place")
+        else:
+            print(f"Restored {stats['segments']} event segments")
+    elif args.command == 'verify':
+        result = backup.verify(args.path)
+        print(f"{result['path']}: integrity {result['integrity']} ({result['seconds']:.2f}s)")
+        for table, count in result['counts'].items():
+            print(f"  {table}: {count} rows")
+        print(f"  students checksum: {result['students_checksum']}")
+    elif args.command == 'archive':
+        result = backup.archive_attendance(args.days)
+        if result['compacted']:
+            print(f"Compacted {result['compacted']} events into daily aggregates")
+        if result['archived']:
+            print(f"Archived {result['archived']} attendance rows to {result['path']}")
+        if result['daily_archived']:
+            print(f"Archived {result['daily_archived']} daily aggregates to {result['daily_path']}")
+        if not result['archived'] and not result['daily_archived']:
+            print(f"No attendance older than {args.days} days")
+        print(f"Archival took {result['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import json
+import math
+import os
+
+# MTCNN's P-Net works on 12x12 windows, nothing smaller can be detected
+MIN_DETECTABLE_FACE = 12
+
+
+class CameraConfig:
+    """Per-camera detection settings"""
+
+    def __init__(self, camera_id="default", camera_number=0, source=0, rois=None, detection_scale=1.0,
+                 seating_distance=None, horizontal_fov=60.0, face_width=0.15,
+                 min_face_size=20, frame_size=(640, 480)):
+        self.camera_id = camera_id
+        # Numeric id stored in compact attendance events
+        self.camera_number = camera_number
+        # Anything cv2.VideoCapture accepts: device index, file or stream URL
+        self.source = source
+        # Regions of interest as (x, y, w, h) fractions of the frame
+        self.rois = [tuple(roi) for roi in rois] if rois else []
+        # Detection runs on frames downscaled by this factor
+        self.detection_scale = detection_scale
+        # Farthest expected seat from the camera in metres
+        self.seating_distance = seating_distance
+        # Horizontal field of view of the lens in degrees
+        self.horizontal_fov = horizontal_fov
+        # Typical face width in metres
+        self.face_width = face_width
+        # Fallback minimum face size in full-resolution pixels
+        self.min_face_size = min_face_size
+        # Capture resolution (width, height); the detector is warmed up at it
+        self.frame_size = tuple(frame_size)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a config from a JSON dictionary"""
+        return cls(**data)
+
+    def pixel_rois(self, frame_width, frame_height):
+        """Return regions of interest in pixels, or the whole frame if none are set"""
+        if not self.rois:
+            return [(0, 0, frame_width, frame_height)]
+
+        regions = []
+        for x, y, w, h in self.rois:
+            left = max(0, int(round(x * frame_width)))
+            top = max(0, int(round(y * frame_height)))
+            right = min(frame_width, int(round((x + w) * frame_width)))
+            bottom = min(frame_height, int(round((y + h) * frame_height)))
+            if right > left and bottom > top:
+                regions.append((left, top, right - left, bottom - top))
+        return regions
+
+    def expected_face_size(self, frame_width):
+        """Smallest face width in full-resolution pixels at the farthest seat"""
+        if not self.seating_distance:
+            return self.min_face_size
+
+        # Pinhole model: focal length in pixels from the horizontal field of view
+        focal_length = (frame_width / 2.0) / math.tan(math.radians(self.horizontal_fov) / 2.0)
+        face_pixels = focal_length * self.face_width / self.seating_distance
+        # Leave some slack for head pose and people sitting a little further back
+        return face_pixels * 0.7
+
+    def detection_min_face_size(self, frame_width):
+        """Minimum face size handed to MTCNN after downscaling"""
+        size = self.expected_face_size(frame_width) * self.detection_scale
+        return max(MIN_DETECTABLE_FACE, int(size))
+
+
+def load_camera_configs(path="cameras.json"):
+    """Load camera configs keyed by camera id from a JSON file"""
+    if not os.path.exists(path):
+        return {"default": CameraConfig()}
+
+    with open(path) as f:
+        data = json.load(f)
+
+    configs = {}
+    for entry in data.get("cameras", []):
+        config = CameraConfig.from_dict(entry)
+        configs[config.camera_id] = config
+    return configs or {"default": CameraConfig()}
@@ -1,10 +1,14 @@
+import hashlib
 import sqlite3
 import os
 from datetime import datetime
+from event_log import AttendanceEventLog, aggregate_events, format_timestamp
 
 class StudentDatabase:
-    def __init__(self, db_path="student_database.db"):
+    def __init__(self, db_path="student_database.db", events_dir="attendance_events"):
         self.db_path = db_path
+        # Shared with every other StudentDatabase on the same directory
+        self.event_log = AttendanceEventLog.shared(events_dir)
         self.init_database()
     
     def init_database(self):
@@ -33,19 +37,78 @@ class StudentDatabase:
             )
         ''')
         
+        # Columns added after the first release
+        cursor.execute('PRAGMA table_info(students)')
+        student_columns = [row[1] for row in cursor.fetchall()]
+        if 'match_threshold' not in student_columns:
+            cursor.execute('ALTER TABLE students ADD COLUMN match_threshold REAL')
+        if 'match_offset' not in student_columns:
+            cursor.execute('ALTER TABLE students ADD COLUMN match_offset REAL')
+            # Absolute thresholds were learned around the fixed 0.5 base
+            cursor.execute('UPDATE students SET match_offset = match_threshold - 0.5 '
+                           'WHERE match_threshold IS NOT NULL')
+        if 'course' not in student_columns:
+            cursor.execute('ALTER TABLE students ADD COLUMN course TEXT')
+        
+        # Reports read attendance by date range
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_timestamp ON attendance (timestamp)')
+        
+        # Per-pose templates; students.face_encoding holds their centroid
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS face_templates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id INTEGER NOT NULL,
+                template BLOB NOT NULL,
+                FOREIGN KEY (student_id) REFERENCES students (id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_face_templates_student ON face_templates (student_id)')
+        
+        # Daily aggregates rolled up from the compact event log
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance_daily (
+                student_id INTEGER,
+                camera_id INTEGER,
+                day TEXT,
+                first_seen TIMESTAMP,
+                last_seen TIMESTAMP,
+                hits INTEGER,
+                best_score REAL,
+                PRIMARY KEY (student_id, camera_id, day),
+                FOREIGN KEY (student_id) REFERENCES students (id)
+            )
+        ''')
+        
+        # Segments already rolled into attendance_daily, so a segment left
+        # behind by a crash after the commit is not counted twice
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS compacted_segments (
+                day TEXT,
+                digest TEXT,
+                events INTEGER,
+                compacted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (day, digest)
+            )
+        ''')
+        
         conn.commit()
         conn.close()
     
-    def add_student(self, name, enrollment_number, face_encoding):
+    def add_student(self, name, enrollment_number, face_encoding, match_offset=None, templates=None,
+                    course=None):
         """Add a new student to the database"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         try:
             cursor.execute('''
-                INSERT INTO students (name, enrollment_number, face_encoding)
-                VALUES (?, ?, ?)
-            ''', (name, enrollment_number, face_encoding))
+                INSERT INTO students (name, enrollment_number, face_encoding, match_offset, course)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (name, enrollment_number, face_encoding, match_offset, course))
+            if templates:
+                student_id = cursor.lastrowid
+                cursor.executemany('INSERT INTO face_templates (student_id, template) VALUES (?, ?)',
+                                   [(student_id, template) for template in templates])
             conn.commit()
             return True
         except sqlite3.IntegrityError:
@@ -65,6 +128,70 @@ class StudentDatabase:
         
         return students
     
+    def update_face_encodings(self, updates):
+        """Replace face encodings in one transaction from (student_id, blob) pairs"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.executemany('UPDATE students SET face_encoding = ? WHERE id = ?',
+                           [(blob, student_id) for student_id, blob in updates])
+        
+        conn.commit()
+        conn.close()
+    
+    def get_face_templates(self):
+        """Get (id, student_id, template) rows for all stored templates"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT id, student_id, template FROM face_templates ORDER BY student_id, id')
+        templates = cursor.fetchall()
+        conn.close()
+        
+        return templates
+    
+    def update_face_templates(self, updates):
+        """Replace templates in one transaction from (template_id, blob) pairs"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.executemany('UPDATE face_templates SET template = ? WHERE id = ?',
+                           [(blob, template_id) for template_id, blob in updates])
+        
+        conn.commit()
+        conn.close()
+    
+    def replace_student_face(self, enrollment_number, face_encoding, match_offset=None, templates=None):
+        """Re-enroll an existing student's face, replacing the encoding and templates"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('UPDATE students SET face_encoding = ?, match_offset = ? WHERE enrollment_number = ?',
+                       (face_encoding, match_offset, enrollment_number))
+        if cursor.rowcount == 0:
+            conn.close()
+            return False
+        cursor.execute('SELECT id FROM students WHERE enrollment_number = ?', (enrollment_number,))
+        student_id = cursor.fetchone()[0]
+        cursor.execute('DELETE FROM face_templates WHERE student_id = ?', (student_id,))
+        cursor.executemany('INSERT INTO face_templates (student_id, template) VALUES (?, ?)',
+                           [(student_id, template) for template in templates or []])
+        
+        conn.commit()
+        conn.close()
+        return True
+    
+    def get_student_offsets(self):
+        """Get per-student match threshold offsets keyed by student id"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT id, match_offset FROM students WHERE match_offset IS NOT NULL')
+        offsets = dict(cursor.fetchall())
+        conn.close()
+        
+        return offsets
+    
     def get_student_by_enrollment(self, enrollment_number):
         """Get student by enrollment number"""
         conn = sqlite3.connect(self.db_path)
@@ -76,6 +203,30 @@ class StudentDatabase:
         
         return student
     
+    def set_student_courses(self, rows):
+        """Assign courses from (enrollment_number, course) rows, returning how many students matched"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.executemany('UPDATE students SET course = ? WHERE enrollment_number = ?',
+                           [(course, enrollment) for enrollment, course in rows])
+        updated = cursor.rowcount
+        
+        conn.commit()
+        conn.close()
+        return updated
+    
+    def get_student_courses(self):
+        """Map student id to course (None when unassigned)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT id, course FROM students')
+        courses = dict(cursor.fetchall())
+        conn.close()
+        
+        return courses
+    
     def mark_attendance(self, student_id, name, enrollment_number):
         """Mark attendance for a student"""
         conn = sqlite3.connect(self.db_path)
@@ -89,6 +240,163 @@ class StudentDatabase:
         conn.commit()
         conn.close()
     
+    def record_event(self, student_id, camera_id=0, score=0.0, timestamp=None):
+        """Append an attendance event (unix timestamp, default now) to the compact event log"""
+        self.event_log.append(student_id, camera_id, score, timestamp)
+    
+    def compact_events(self):
+        """Roll sealed event segments into the attendance_daily table.
+        
+        Each segment's digest is recorded in the same transaction as its
+        aggregates, so compacting again after a crash only removes it.
+        """
+        compacted = 0
+        for day, path in self.event_log.sealed_segments():
+            events = self.event_log.read_segment(path)
+            digest = hashlib.sha1(events.tobytes()).hexdigest()
+            count = len(events)
+            rows = aggregate_events(events)
+            del events
+            
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1 FROM compacted_segments WHERE day = ? AND digest = ?', (day, digest))
+            if cursor.fetchone():
+                conn.close()
+                self.event_log.remove_segment(path)
+                continue
+            
+            compacted += count
+            cursor.executemany('''
+                INSERT INTO attendance_daily
+                    (student_id, camera_id, day, first_seen, last_seen, hits, best_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (student_id, camera_id, day) DO UPDATE SET
+                    first_seen = MIN(first_seen, excluded.first_seen),
+                    last_seen = MAX(last_seen, excluded.last_seen),
+                    hits = hits + excluded.hits,
+                    best_score = MAX(best_score, excluded.best_score)
+            ''', [(student_id, camera_id, row_day, format_timestamp(first_seen),
+                   format_timestamp(last_seen), hits, best_score)
+                  for student_id, camera_id, row_day, first_seen, last_seen, hits, best_score in rows])
+            cursor.execute('INSERT INTO compacted_segments (day, digest, events) VALUES (?, ?, ?)',
+                           (day, digest, count))
+            conn.commit()
+            conn.close()
+            
+            # Only drop the segment once its aggregates are committed
+            self.event_log.remove_segment(path)
+        
+        return compacted
+    
+    def get_event_records(self):
+        """Attendance rows from daily aggregates and uncompacted event segments.
+        
+        Each (student, day) appears once, stamped with the first sighting, in
+        the same (id, student_id, name, enrollment_number, timestamp) layout as
+        the attendance table. The id is None because events have no row id.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT student_id, day, MIN(first_seen) FROM attendance_daily
+            GROUP BY student_id, day
+        ''')
+        first_seen = {(student_id, day): timestamp for student_id, day, timestamp in cursor.fetchall()}
+        
+        # Merge recent segments that have not been compacted yet
+        for student_id, _, day, first, _, _, _ in aggregate_events(self.event_log.read_events()):
+            timestamp = format_timestamp(first)
+            key = (student_id, day)
+            if key not in first_seen or timestamp < first_seen[key]:
+                first_seen[key] = timestamp
+        
+        if not first_seen:
+            conn.close()
+            return []
+        
+        cursor.execute('SELECT id, name, enrollment_number FROM students')
+        students = {student_id: (name, enrollment) for student_id, name, enrollment in cursor.fetchall()}
+        conn.close()
+        
+        records = []
+        for (student_id, _), timestamp in first_seen.items():
+            name, enrollment = students.get(student_id, (None, None))
+            records.append((None, student_id, name, enrollment, timestamp))
+        return records
+    
+    def mark_attendance_batch(self, rows):
+        """Mark attendance for (student_id, name, enrollment_number[, timestamp]) rows in one transaction.
+        
+        Timestamps are UTC 'YYYY-MM-DD HH:MM:SS' strings; rows without one
+        are stamped with the current time.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.executemany('''
+            INSERT INTO attendance (student_id, name, enrollment_number, timestamp)
+            VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ''', [tuple(row) + (None,) * (4 - len(row)) for row in rows])
+        
+        conn.commit()
+        conn.close()
+    
+    def get_course_day_fingerprints(self, start, end):
+        """Per (course, day) marks, students and newest row id for start <= timestamp < end.
+        
+        Cheap enough to run on every report; a (course, day) whose numbers
+        have not changed does not need its sheet rebuilt.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT s.course, DATE(a.timestamp) AS day, COUNT(*), COUNT(DISTINCT a.student_id), MAX(a.id)
+            FROM attendance a LEFT JOIN students s ON s.id = a.student_id
+            WHERE a.timestamp >= ? AND a.timestamp < ?
+            GROUP BY s.course, day
+        ''', (start, end))
+        fingerprints = {(course, day): (marks, students, last_id)
+                        for course, day, marks, students, last_id in cursor.fetchall()}
+        conn.close()
+        
+        return fingerprints
+    
+    def get_course_day_attendance(self, start, end, days=None):
+        """Attendance for start <= timestamp < end in one pass grouped by course, day and student.
+        
+        Returns (course, day, student_id, name, enrollment_number, first_seen,
+        last_seen, marks) rows ordered by course and day. days restricts the
+        result to those dates.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        day_filter = ''
+        params = [start, end]
+        if days is not None:
+            days = sorted(days)
+            if not days:
+                conn.close()
+                return []
+            day_filter = f"AND DATE(a.timestamp) IN ({', '.join('?' * len(days))})"
+            params.extend(days)
+        
+        cursor.execute(f'''
+            SELECT s.course, DATE(a.timestamp) AS day, a.student_id, a.name, a.enrollment_number,
+                   MIN(a.timestamp), MAX(a.timestamp), COUNT(*)
+            FROM attendance a LEFT JOIN students s ON s.id = a.student_id
+            WHERE a.timestamp >= ? AND a.timestamp < ? {day_filter}
+            GROUP BY s.course, day, a.student_id
+            ORDER BY s.course, day
+        ''', params)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return rows
+    
     def get_attendance_records(self):
         """Get all attendance records"""
         conn = sqlite3.connect(self.db_path)
@@ -98,6 +406,10 @@ class StudentDatabase:
         records = cursor.fetchall()
         conn.close()
         
+        event_records = self.get_event_records()
+        if event_records:
+            records = sorted(records + event_records, key=lambda record: record[4], reverse=True)
+        
         return records
     
     def delete_all_attendance(self):
@@ -105,12 +417,18 @@ class StudentDatabase:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        deleted_count = len(self.get_event_records())
+        
         cursor.execute('DELETE FROM attendance')
-        deleted_count = cursor.rowcount
+        deleted_count += cursor.rowcount
+        cursor.execute('DELETE FROM attendance_daily')
+        cursor.execute('DELETE FROM compacted_segments')
         
         conn.commit()
         conn.close()
         
+        self.event_log.clear()
+        
         return deleted_count
     
     def delete_all_students(self):
@@ -119,8 +437,13 @@ class StudentDatabase:
         cursor = conn.cursor()
         
         # Delete attendance records first (foreign key constraint)
+        attendance_deleted = len(self.get_event_records())
         cursor.execute('DELETE FROM attendance')
-        attendance_deleted = cursor.rowcount
+        attendance_deleted += cursor.rowcount
+        cursor.execute('DELETE FROM attendance_daily')
+        cursor.execute('DELETE FROM compacted_segments')
+        self.event_log.clear()
+        cursor.execute('DELETE FROM face_templates')
         
         # Delete students
         cursor.execute('DELETE FROM students')
@@ -140,7 +463,7 @@ class StudentDatabase:
         count = cursor.fetchone()[0]
         conn.close()
         
-        return count
+        return count + len(self.get_event_records())
     
     def get_student_count(self):
         """Get count of students"""
@@ -0,0 +1,245 @@
+import argparse
+import os
+import struct
+import numpy as np
+
+# Versioned embedding blob:
+#   magic 'FEMB' | version u8 | flags u8 | dtype u8 | model id length u8 |
+#   dimension u16 | int8 scale f32 | model id (utf-8) | payload
+# When encrypted the payload is a 12 byte nonce followed by the AES-GCM
+# ciphertext, with the header bound as associated data.
+MAGIC = b'FEMB'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBBBHf')
+
+FLAG_NORMALIZED = 0x01
+FLAG_ENCRYPTED = 0x02
+
+DTYPE_CODES = {'float32': 0, 'float16': 1, 'int8': 2}
+CODE_DTYPES = {code: name for name, code in DTYPE_CODES.items()}
+
+# Model ids name the network and the preprocessing, since embeddings of
+# aligned and plainly cropped faces are not comparable
+ALIGNED_MODEL_ID = "facenet-vggface2-align5"
+CROP_MODEL_ID = "facenet-vggface2-crop"
+DEFAULT_MODEL_ID = ALIGNED_MODEL_ID
+# Raw blobs predate alignment, so they are crop embeddings
+LEGACY_MODEL_ID = CROP_MODEL_ID
+LEGACY_DIMENSION = 512
+KEY_ENV_VAR = "FACE_EMBEDDING_KEY_FILE"
+
+
+class ModelMismatchError(ValueError):
+    """Embedding was made by a different model or preprocessing than expected"""
+
+
+def model_id_for(use_alignment):
+    """Model id of the embeddings produced with or without alignment"""
+    return ALIGNED_MODEL_ID if use_alignment else CROP_MODEL_ID
+
+
+def _aesgcm(key):
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    except ImportError:
+        raise RuntimeError("Encrypted embeddings need the 'cryptography' package")
+    return AESGCM(key)
+
+
+def load_key(path=None):
+    """Read a 32 byte key from path or the FACE_EMBEDDING_KEY_FILE file, if any"""
+    path = path or os.environ.get(KEY_ENV_VAR)
+    if not path:
+        return None
+
+    with open(path, 'rb') as f:
+        data = f.read().strip()
+    key = bytes.fromhex(data.decode()) if len(data) == 64 else data
+    if len(key) != 32:
+        raise ValueError(f"Embedding key in {path} must be 32 bytes (or 64 hex characters)")
+    return key
+
+
+def generate_key(path):
+    """Write a new random key as hex, readable only by the owner"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(os.urandom(32).hex())
+
+
+def is_versioned(blob):
+    """True if blob uses the versioned format rather than raw array bytes"""
+    return blob is not None and bytes(blob[:4]) == MAGIC
+
+
+def encode_embedding(encoding, model_id=DEFAULT_MODEL_ID, dtype='float32', normalize=True, key=None):
+    """Serialise an embedding with a header, optional quantization and encryption"""
+    vector = np.asarray(encoding, dtype=np.float32).reshape(-1)
+    flags = 0
+    if normalize:
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        flags |= FLAG_NORMALIZED
+
+    scale = 1.0
+    if dtype == 'float32':
+        payload = vector.astype('<f4').tobytes()
+    elif dtype == 'float16':
+        payload = vector.astype('<f2').tobytes()
+    elif dtype == 'int8':
+        # Symmetric per-vector quantization
+        peak = float(np.abs(vector).max())
+        scale = peak / 127.0 if peak > 0 else 1.0
+        payload = np.clip(np.round(vector / scale), -127, 127).astype(np.int8).tobytes()
+    else:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+    if key is not None:
+        flags |= FLAG_ENCRYPTED
+
+    model_bytes = model_id.encode('utf-8')
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, flags, DTYPE_CODES[dtype],
+                         len(model_bytes), vector.shape[0], scale) + model_bytes
+
+    if key is not None:
+        nonce = os.urandom(12)
+        payload = nonce + _aesgcm(key).encrypt(nonce, payload, header)
+
+    return header + payload
+
+
+def read_header(blob):
+    """Parse the header of a versioned blob into a dict"""
+    magic, version, flags, dtype_code, model_length, dimension, scale = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not a versioned embedding")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding format version {version}")
+
+    model_end = HEADER.size + model_length
+    return {
+        'version': version,
+        'model_id': bytes(blob[HEADER.size:model_end]).decode('utf-8'),
+        'dtype': CODE_DTYPES[dtype_code],
+        'dimension': dimension,
+        'normalized': bool(flags & FLAG_NORMALIZED),
+        'encrypted': bool(flags & FLAG_ENCRYPTED),
+        'scale': scale,
+        'header_size': model_end
+    }
+
+
+def blob_model_id(blob):
+    """Model id recorded in a blob; legacy blobs are LEGACY_MODEL_ID"""
+    return read_header(blob)['model_id'] if is_versioned(blob) else LEGACY_MODEL_ID
+
+
+def decode_legacy(blob, dimension=LEGACY_DIMENSION):
+    """Decode a raw tobytes() blob written before the versioned format"""
+    size = len(blob)
+    if size == dimension * 4:
+        return np.frombuffer(blob, dtype=np.float32).copy()
+    if size == dimension * 8:
+        # np.mean of float64 captures
+        return np.frombuffer(blob, dtype=np.float64).astype(np.float32)
+    raise ValueError(f"Cannot infer dtype of a {size} byte legacy embedding")
+
+
+def decode_embedding(blob, key=None, expected_model=None):
+    """Deserialise an embedding blob (versioned or legacy) to float32.
+
+    Legacy blobs count as LEGACY_MODEL_ID. Raises ModelMismatchError when
+    expected_model is given and differs from the blob's model. Quantized
+    payloads are widened too, so float16/int8 storage shrinks the database
+    but not the in-memory gallery.
+    """
+    blob = bytes(blob)
+    if not is_versioned(blob):
+        if expected_model is not None and expected_model != LEGACY_MODEL_ID:
+            raise ModelMismatchError(f"Embedding was made by {LEGACY_MODEL_ID}, expected {expected_model}")
+        return decode_legacy(blob)
+
+    header = read_header(blob)
+    if expected_model is not None and header['model_id'] != expected_model:
+        raise ModelMismatchError(f"Embedding was made by {header['model_id']}, expected {expected_model}")
+
+    payload = blob[header['header_size']:]
+    if header['encrypted']:
+        if key is None:
+            raise ValueError("Embedding is encrypted but no key was supplied")
+        cipher = _aesgcm(key)
+        try:
+            payload = cipher.decrypt(payload[:12], payload[12:], blob[:header['header_size']])
+        except Exception:
+            # Wrong key or tampered blob
+            raise ValueError("Embedding could not be decrypted with the supplied key")
+
+    dtype = {'float32': '<f4', 'float16': '<f2', 'int8': np.int8}[header['dtype']]
+    vector = np.frombuffer(payload, dtype=dtype)
+    if vector.shape[0] != header['dimension']:
+        raise ValueError(f"Embedding has {vector.shape[0]} values, header says {header['dimension']}")
+
+    vector = vector.astype(np.float32)
+    if header['dtype'] == 'int8':
+        vector *= header['scale']
+    return vector
+
+
+def migrate_embeddings(db, dtype='float32', key=None, old_key=None, model_id=LEGACY_MODEL_ID):
+    """Rewrite every stored embedding and template in the versioned format.
+
+    Legacy rows are tagged with model_id (the crop model they were made
+    with); versioned rows keep their model.
+    Returns the number of blobs rewritten.
+    """
+    updates = []
+    for student_id, name, enrollment, face_encoding in db.get_all_students():
+        if not face_encoding:
+            continue
+        row_model = read_header(face_encoding)['model_id'] if is_versioned(face_encoding) else model_id
+        encoding = decode_embedding(face_encoding, old_key)
+        updates.append((student_id, encode_embedding(encoding, row_model, dtype, True, key)))
+
+    template_updates = []
+    for template_id, _, template in db.get_face_templates():
+        row_model = read_header(template)['model_id'] if is_versioned(template) else model_id
+        encoding = decode_embedding(template, old_key)
+        template_updates.append((template_id, encode_embedding(encoding, row_model, dtype, True, key)))
+
+    db.update_face_encodings(updates)
+    db.update_face_templates(template_updates)
+    return len(updates) + len(template_updates)
+
+
+def main():
+    from database import StudentDatabase
+
+    parser = argparse.ArgumentParser(description="Embedding storage format tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help="Convert stored embeddings to the versioned format")
+    migrate_parser.add_argument('--db', default="student_database.db")
+    migrate_parser.add_argument('--dtype', choices=sorted(DTYPE_CODES), default='float32')
+    migrate_parser.add_argument('--key-file', help="Encrypt with this key (defaults to $%s)" % KEY_ENV_VAR)
+    migrate_parser.add_argument('--old-key-file', help="Key the embeddings are currently encrypted with")
+    migrate_parser.add_argument('--decrypt', action='store_true', help="Store without encryption")
+
+    key_parser = subparsers.add_parser('genkey', help="Create a new encryption key file")
+    key_parser.add_argument('path')
+
+    args = parser.parse_args()
+    if args.command == 'genkey':
+        generate_key(args.path)
+        print(f"Wrote new embedding key to {args.path}")
+        return
+
+    key = None if args.decrypt else load_key(args.key_file)
+    old_key = load_key(args.old_key_file) if args.old_key_file else load_key()
+    db = StudentDatabase(args.db)
+    count = migrate_embeddings(db, args.dtype, key, old_key)
+    print(f"Migrated {count} embeddings to {args.dtype}{' (encrypted)' if key else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import argparse
+import os
+import time
+import numpy as np
+from gallery import FaceGallery, synthetic_gallery, synthetic_samples
+from open_set import OpenSetMatcher, learn_student_offset, normalize_rows
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_labeled_images(root):
+    """List (label, path) pairs from a root/<identity>/<image> directory tree"""
+    samples = []
+    for label in sorted(os.listdir(root)):
+        label_dir = os.path.join(root, label)
+        if not os.path.isdir(label_dir):
+            continue
+        for filename in sorted(os.listdir(label_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((label, os.path.join(label_dir, filename)))
+    return samples
+
+
+def genuine_impostor_distances(encodings, labels):
+    """Split all pairwise cosine distances into genuine and impostor sets"""
+    normalized = normalize_rows(encodings)
+    distances = 1.0 - normalized @ normalized.T
+    labels = np.asarray(labels)
+    same = labels[:, None] == labels[None, :]
+    upper = np.triu(np.ones_like(same, dtype=bool), k=1)
+    return distances[same & upper], distances[~same & upper]
+
+
+def equal_error_rate(genuine, impostor):
+    """Approximate EER by sweeping every observed distance as a threshold"""
+    thresholds = np.unique(np.concatenate([genuine, impostor]))
+    frr = np.array([(genuine > t).mean() for t in thresholds])
+    far = np.array([(impostor <= t).mean() for t in thresholds])
+    best = np.argmin(np.abs(frr - far))
+    return (frr[best] + far[best]) / 2.0, thresholds[best]
+
+
+def separation_report(genuine, impostor):
+    """Summarise how well genuine and impostor distances separate"""
+    pooled_std = np.sqrt((genuine.var() + impostor.var()) / 2.0)
+    d_prime = abs(impostor.mean() - genuine.mean()) / pooled_std if pooled_std > 0 else float('inf')
+    eer, eer_threshold = equal_error_rate(genuine, impostor)
+    return {
+        'genuine_pairs': len(genuine),
+        'impostor_pairs': len(impostor),
+        'genuine_mean': float(genuine.mean()),
+        'impostor_mean': float(impostor.mean()),
+        'd_prime': float(d_prime),
+        'eer': float(eer),
+        'eer_threshold': float(eer_threshold)
+    }
+
+
+def embed_labeled_images(system, samples, use_alignment):
+    """Embed the most confident face in every labeled image"""
+    import cv2
+
+    system.use_alignment = use_alignment
+    encodings, labels = [], []
+    for label, path in samples:
+        frame = cv2.imread(path)
+        if frame is None:
+            print(f"Could not read {path}")
+            continue
+        faces = system.mtcnn.detect_faces(frame)
+        if not faces:
+            print(f"No face detected in {path}")
+            continue
+        face = max(faces, key=lambda f: f['confidence'])
+        embedded = system.embed_faces(frame, [face])
+        if len(embedded) == 0:
+            # The crop can still fail (e.g. a box touching the border)
+            print(f"Could not embed the face in {path}")
+            continue
+        encodings.append(embedded[0])
+        labels.append(label)
+    return np.array(encodings), labels
+
+
+def evaluate_alignment(root):
+    """Compare genuine/impostor separation with and without alignment"""
+    from face_recognition_system import FaceRecognitionSystem
+
+    samples = load_labeled_images(root)
+    if not samples:
+        print(f"No labeled images found under {root}")
+        return None
+
+    system = FaceRecognitionSystem()
+    reports = {}
+    for mode, use_alignment in (('crop', False), ('aligned', True)):
+        encodings, labels = embed_labeled_images(system, samples, use_alignment)
+        if len(set(labels)) < 2:
+            print("Need at least two identities with detectable faces")
+            return None
+        genuine, impostor = genuine_impostor_distances(encodings, labels)
+        reports[mode] = separation_report(genuine, impostor)
+
+    print(f"{'Metric':<16}{'Crop':>12}{'Aligned':>12}")
+    for key in ('genuine_mean', 'impostor_mean', 'd_prime', 'eer', 'eer_threshold'):
+        print(f"{key:<16}{reports['crop'][key]:>12.4f}{reports['aligned'][key]:>12.4f}")
+    print(f"Pairs: {reports['aligned']['genuine_pairs']} genuine, "
+          f"{reports['aligned']['impostor_pairs']} impostor")
+    return reports
+
+
+def split_gallery_and_probes(encodings, labels, enroll_per_person=3, unknown_every=4):
+    """Split embeddings into enrollment templates, known probes and unknown probes.
+
+    Every unknown_every-th identity is left out of the gallery entirely so
+    its images measure false accepts of people who were never enrolled.
+    """
+    identities = sorted(set(labels))
+    unknown = set(identities[::unknown_every]) if unknown_every else set()
+    labels = np.asarray(labels)
+
+    gallery_labels, templates = [], []
+    probes, probe_targets, unknown_probes = [], [], []
+    for identity in identities:
+        rows = encodings[labels == identity]
+        if identity in unknown:
+            unknown_probes.extend(rows)
+        elif len(rows) > enroll_per_person:
+            probe_targets.extend([len(gallery_labels)] * (len(rows) - enroll_per_person))
+            probes.extend(rows[enroll_per_person:])
+            gallery_labels.append(identity)
+            templates.append(rows[:enroll_per_person])
+
+    return (gallery_labels, templates, np.array(probes), np.array(probe_targets),
+            np.array(unknown_probes))
+
+
+def sweep_operating_points(templates, probes, probe_targets, unknown_probes,
+                           thresholds, margin, per_student):
+    """FAR, FRR and misidentification rate at each similarity threshold"""
+    points = []
+    for threshold in thresholds:
+        matcher = OpenSetMatcher(threshold=threshold, margin=margin)
+        student_offsets = None
+        if per_student:
+            student_offsets = [learn_student_offset(student_templates, threshold)
+                               for student_templates in templates]
+        matcher.fit(templates, student_offsets)
+
+        known_indices, _, _ = matcher.match(probes)
+        unknown_indices, _, _ = matcher.match(unknown_probes)
+        points.append({
+            'threshold': float(threshold),
+            'far': float((unknown_indices >= 0).mean()) if len(unknown_indices) else 0.0,
+            'frr': float((known_indices != probe_targets).mean()) if len(known_indices) else 0.0,
+            'misid': float(((known_indices >= 0) & (known_indices != probe_targets)).mean())
+            if len(known_indices) else 0.0
+        })
+    return points
+
+
+def calibrate(root, enroll_per_person=3, unknown_every=4, margin=0.08, per_student=False):
+    """Sweep open-set thresholds over a labeled set and report FAR/FRR"""
+    from face_recognition_system import FaceRecognitionSystem
+
+    samples = load_labeled_images(root)
+    if not samples:
+        print(f"No labeled images found under {root}")
+        return None
+
+    system = FaceRecognitionSystem()
+    encodings, labels = embed_labeled_images(system, samples, use_alignment=True)
+    gallery_labels, templates, probes, probe_targets, unknown_probes = split_gallery_and_probes(
+        encodings, labels, enroll_per_person, unknown_every)
+    if len(gallery_labels) < 2 or len(probes) == 0:
+        print(f"Need at least two identities with more than {enroll_per_person} images")
+        return None
+
+    thresholds = np.arange(0.20, 0.851, 0.05)
+    points = sweep_operating_points(templates, probes, probe_targets, unknown_probes,
+                                    thresholds, margin, per_student)
+
+    print(f"Gallery: {len(gallery_labels)} students, {len(probes)} known probes, "
+          f"{len(unknown_probes)} unknown probes, margin {margin:.2f}"
+          f"{', per-student thresholds' if per_student else ''}")
+    print(f"{'Threshold':>10}{'FAR':>10}{'FRR':>10}{'MisID':>10}")
+    for point in points:
+        print(f"{point['threshold']:>10.2f}{point['far']:>10.4f}{point['frr']:>10.4f}{point['misid']:>10.4f}")
+    return points
+
+
+def benchmark_gallery(students=10000, templates_per_student=3, queries=500, shortlist=8, repeats=3):
+    """Compare single-template, exhaustive multi-template and two-stage matching"""
+    identities, pose_offsets = synthetic_gallery(students, templates_per_student)
+    rng = np.random.default_rng(2)
+    truth = rng.integers(0, students, size=queries)
+    probes = synthetic_samples(identities, pose_offsets, truth)
+
+    # Enrollment templates: one noisy capture per pose
+    enrolled = np.stack([
+        synthetic_samples(identities, pose_offsets[:, [pose]], np.arange(students), seed=10 + pose)
+        for pose in range(templates_per_student)
+    ], axis=1)
+    gallery = FaceGallery(shortlist).build(list(enrolled))
+
+    methods = (
+        ('single (centroid)', gallery.match_centroids),
+        ('multi (exhaustive)', gallery.match_exhaustive),
+        ('multi (two-stage)', gallery.match),
+    )
+    results = {}
+    for name, method in methods:
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            indices, _ = method(probes)
+            best = min(best, time.perf_counter() - start)
+        results[name] = (best, indices[:, 0])
+
+    exhaustive = results['multi (exhaustive)'][1]
+    print(f"Gallery: {students} students x {templates_per_student} templates, "
+          f"{queries} queries, shortlist {shortlist}")
+    print(f"{'Method':<22}{'ms/query':>10}{'Top-1 acc':>11}{'Agrees w/ exhaustive':>22}")
+    for name, (seconds, top1) in results.items():
+        print(f"{name:<22}{seconds / queries * 1000:>10.4f}{(top1 == truth).mean():>11.4f}"
+              f"{(top1 == exhaustive).mean():>22.4f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Face recognition evaluation tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    alignment_parser = subparsers.add_parser(
+        'alignment', help="Measure genuine/impostor separation with and without alignment")
+    alignment_parser.add_argument('root', help="Directory with one sub-folder of images per person")
+
+    calibrate_parser = subparsers.add_parser(
+        'calibrate', help="Sweep open-set thresholds and report FAR/FRR at each operating point")
+    calibrate_parser.add_argument('root', help="Directory with one sub-folder of images per person")
+    calibrate_parser.add_argument('--enroll', type=int, default=3,
+                                  help="Images per person used as enrollment templates")
+    calibrate_parser.add_argument('--unknown-every', type=int, default=4,
+                                  help="Hold out every n-th person as never enrolled")
+    calibrate_parser.add_argument('--margin', type=float, default=0.08,
+                                  help="Minimum gap between best and second-best student")
+    calibrate_parser.add_argument('--per-student', action='store_true',
+                                  help="Learn per-student thresholds from the enrollment templates")
+
+    benchmark_parser = subparsers.add_parser(
+        'benchmark-gallery', help="Benchmark two-stage multi-template matching on a synthetic gallery")
+    benchmark_parser.add_argument('--students', type=int, default=10000)
+    benchmark_parser.add_argument('--templates', type=int, default=3)
+    benchmark_parser.add_argument('--queries', type=int, default=500)
+    benchmark_parser.add_argument('--shortlist', type=int, default=8)
+
+    args = parser.parse_args()
+    if args.command == 'alignment':
+        evaluate_alignment(args.root)
+    elif args.command == 'calibrate':
+        calibrate(args.root, args.enroll, args.unknown_every, args.margin, args.per_student)
+    elif args.command == 'benchmark-gallery':
+        benchmark_gallery(args.students, args.templates, args.queries, args.shortlist)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import asyncio
+import concurrent.futures
+import csv
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import deque
+from event_log import format_timestamp
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
+
+class Sink:
+    """Base class for event bus consumers.
+
+    Subclasses implement write_batch. Each sink has its own bounded buffer;
+    when it is full the overflow policy drops either the oldest buffered
+    event or the incoming one, so a slow sink never holds up the others.
+    Events of priority_types are only dropped when nothing else is left to
+    drop, so per-frame recognition events cannot push out attendance.
+    """
+
+    def __init__(self, name, batch_size=64, flush_interval=1.0, max_buffer=1000,
+                 overflow=DROP_OLDEST, event_types=None, priority_types=('attendance',)):
+        if overflow not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.overflow = overflow
+        # None accepts every event type
+        self.event_types = set(event_types) if event_types else None
+        self.priority_types = set(priority_types)
+
+    def accepts(self, event):
+        return self.event_types is None or event['type'] in self.event_types
+
+    async def write_batch(self, events):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CsvSink(Sink):
+    """Append events to a CSV live log"""
+
+    FIELDS = ['type', 'timestamp', 'camera_id', 'student_id', 'name', 'enrollment', 'score']
+
+    def __init__(self, path="attendance_live.csv", **kwargs):
+        super().__init__(kwargs.pop('name', 'csv'), **kwargs)
+        self.path = path
+
+    def _write(self, events):
+        new_file = not os.path.exists(self.path)
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.FIELDS, extrasaction='ignore')
+            if new_file:
+                writer.writeheader()
+            writer.writerows(events)
+
+    async def write_batch(self, events):
+        await asyncio.get_running_loop().run_in_executor(None, self._write, events)
+
+
+class SQLiteSink(Sink):
+    """Store attendance events in the student database"""
+
+    def __init__(self, db, use_event_log=False, **kwargs):
+        kwargs.setdefault('event_types', ['attendance'])
+        super().__init__(kwargs.pop('name', 'sqlite'), **kwargs)
+        self.db = db
+        # Write compact event log records instead of attendance rows
+        self.use_event_log = use_event_log
+
+    def _write(self, events):
+        if self.use_event_log:
+            for event in events:
+                self.db.record_event(event['student_id'], event['camera_id'], event['score'],
+                                     event['published_at'])
+        else:
+            # Stamp rows with the time of the sighting, not of the flush
+            self.db.mark_attendance_batch([(event['student_id'], event['name'], event['enrollment'],
+                                            event['timestamp']) for event in events])
+
+    async def write_batch(self, events):
+        await asyncio.get_running_loop().run_in_executor(None, self._write, events)
+
+
+class WebhookSink(Sink):
+    """POST batches of events as JSON to a (local) HTTP endpoint"""
+
+    def __init__(self, url="http://127.0.0.1:8080/attendance", timeout=2.0, **kwargs):
+        super().__init__(kwargs.pop('name', 'webhook'), **kwargs)
+        self.url = url
+        self.timeout = timeout
+
+    def _post(self, events):
+        request = urllib.request.Request(self.url, data=json.dumps(events).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    async def write_batch(self, events):
+        await asyncio.get_running_loop().run_in_executor(None, self._post, events)
+
+
+class _SinkState:
+    """Buffer and counters for one sink, owned by the bus loop"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.buffer = deque()
+        self.wakeup = None
+        self.task = None
+        self.published = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.batches = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        # Events taken from the buffer whose batch is being written
+        self.in_flight = 0
+
+
+class AttendanceEventBus:
+    """Fan recognition and attendance events out to sinks on a background asyncio loop.
+
+    publish() is thread-safe and never blocks the caller: it only schedules
+    the event onto the bus loop, which buffers it per sink. Each sink drains
+    its buffer in batches of up to batch_size, or every flush_interval
+    seconds, whichever comes first.
+    """
+
+    def __init__(self, sinks):
+        self.states = [_SinkState(sink) for sink in sinks]
+        self.loop = None
+        self._thread = None
+        self._started = threading.Event()
+        self._stopping = False
+
+    def start(self):
+        """Start the bus loop on a daemon thread"""
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        for state in self.states:
+            state.wakeup = asyncio.Event()
+            state.task = self.loop.create_task(self._drain(state))
+        self._started.set()
+        self.loop.run_forever()
+        # Cancel writes still pending after a stop() that timed out
+        pending = asyncio.all_tasks(self.loop)
+        for task in pending:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.loop.close()
+
+    def publish(self, event_type, **fields):
+        """Queue an event for every sink without blocking"""
+        if self.loop is None or self._stopping:
+            return
+        event = dict(fields, type=event_type)
+        event['published_at'] = time.time()
+        # UTC, formatted like the attendance table's CURRENT_TIMESTAMP
+        event.setdefault('timestamp', format_timestamp(event['published_at']))
+        self.loop.call_soon_threadsafe(self._dispatch, event)
+
+    def _dispatch(self, event):
+        for state in self.states:
+            if not state.sink.accepts(event):
+                continue
+            state.published += 1
+            if len(state.buffer) >= state.sink.max_buffer:
+                state.dropped += 1
+                if not self._make_room(state, event):
+                    continue
+            state.buffer.append(event)
+            if len(state.buffer) >= state.sink.batch_size:
+                state.wakeup.set()
+
+    @staticmethod
+    def _make_room(state, event):
+        """Drop one event from a full buffer; False means drop the incoming one"""
+        sink = state.sink
+        buffer = state.buffer
+        incoming_priority = event['type'] in sink.priority_types
+        if not incoming_priority and sink.overflow == DROP_NEWEST:
+            return False
+
+        # Oldest (or newest) buffered event that is not a priority type
+        order = range(len(buffer)) if sink.overflow == DROP_OLDEST else range(len(buffer) - 1, -1, -1)
+        for index in order:
+            if buffer[index]['type'] not in sink.priority_types:
+                del buffer[index]
+                return True
+
+        # Only priority events are buffered
+        if not incoming_priority or sink.overflow == DROP_NEWEST:
+            return False
+        buffer.popleft()
+        return True
+
+    async def _drain(self, state):
+        sink = state.sink
+        while True:
+            try:
+                await asyncio.wait_for(state.wakeup.wait(), sink.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            state.wakeup.clear()
+
+            while state.buffer:
+                count = min(sink.batch_size, len(state.buffer))
+                batch = [state.buffer.popleft() for _ in range(count)]
+                state.in_flight = len(batch)
+                try:
+                    await sink.write_batch(batch)
+                    state.written += len(batch)
+                    state.batches += 1
+                except Exception as e:
+                    state.errors += 1
+                    print(f"Event sink {sink.name} failed: {e}")
+                finally:
+                    state.in_flight = 0
+
+                # Lag: how long the oldest event in the batch waited
+                state.last_lag = time.time() - batch[0]['published_at']
+                state.max_lag = max(state.max_lag, state.last_lag)
+
+            if self._stopping:
+                return
+
+    def metrics(self):
+        """Per-sink buffer depth, throughput, drops, errors and lag"""
+        now = time.time()
+        return {
+            state.sink.name: {
+                'buffered': len(state.buffer),
+                'published': state.published,
+                'written': state.written,
+                'dropped': state.dropped,
+                'errors': state.errors,
+                'batches': state.batches,
+                'lag_seconds': state.last_lag,
+                'max_lag_seconds': state.max_lag,
+                # Age of the oldest event still waiting, 0 when caught up
+                'backlog_seconds': now - state.buffer[0]['published_at'] if state.buffer else 0.0
+            }
+            for state in self.states
+        }
+
+    def stop(self, timeout=5.0):
+        """Flush every buffer and stop the loop"""
+        if self.loop is None:
+            return
+
+        async def flush():
+            self._stopping = True
+            for state in self.states:
+                state.wakeup.set()
+            await asyncio.gather(*(state.task for state in self.states), return_exceptions=True)
+
+        future = asyncio.run_coroutine_threadsafe(flush(), self.loop)
+        try:
+            future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # A slow sink must not keep the application from closing
+            pending = ", ".join(f"{state.sink.name} {len(state.buffer) + state.in_flight}"
+                                for state in self.states if state.buffer or state.in_flight)
+            print(f"Event bus did not flush within {timeout:.0f}s; events left unwritten: {pending or 'none'}")
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+            for state in self.states:
+                state.sink.close()
+            self.loop = None
+            self._thread = None
+
+
+def build_event_bus(db, use_event_log=False, csv_path=None, webhook_url=None):
+    """Started bus with a SQLite sink plus an optional CSV log and webhook"""
+    sinks = [SQLiteSink(db, use_event_log=use_event_log)]
+    if csv_path:
+        sinks.append(CsvSink(csv_path))
+    if webhook_url:
+        sinks.append(WebhookSink(webhook_url))
+    return AttendanceEventBus(sinks).start()
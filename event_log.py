@@ -0,0 +1,174 @@
+import argparse
+import os
+import threading
+from datetime import datetime, timezone
+import numpy as np
+
+# Fixed-width 20 byte record, little endian so segments are portable
+EVENT_DTYPE = np.dtype([
+    ('student_id', '<u4'),
+    ('camera_id', '<u2'),
+    ('reserved', '<u2'),
+    ('timestamp', '<f8'),
+    ('score', '<f4'),
+])
+
+SEGMENT_PREFIX = "events_"
+SEGMENT_SUFFIX = ".seg"
+
+
+def utc_day(timestamp):
+    """Segment day (YYYYMMDD, UTC) for a unix timestamp"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y%m%d")
+
+
+def format_timestamp(timestamp):
+    """Format a unix timestamp like SQLite's CURRENT_TIMESTAMP"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+_shared_logs = {}
+_shared_lock = threading.Lock()
+
+
+class AttendanceEventLog:
+    """Append-only attendance events in fixed-width segments, one file per UTC day.
+
+    Each append opens and closes its segment, so no handle outlives a
+    delete, compaction or restore by another instance or process; use
+    shared() to get the one instance per directory within this process.
+    """
+
+    def __init__(self, directory="attendance_events"):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, directory="attendance_events"):
+        """The process-wide event log for a directory"""
+        key = os.path.abspath(directory)
+        with _shared_lock:
+            if key not in _shared_logs:
+                _shared_logs[key] = cls(directory)
+            return _shared_logs[key]
+
+    def segment_path(self, day):
+        """Path of the segment holding events for a YYYYMMDD day"""
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{day}{SEGMENT_SUFFIX}")
+
+    def append(self, student_id, camera_id=0, score=0.0, timestamp=None):
+        """Append one event to the current day's segment"""
+        if timestamp is None:
+            timestamp = datetime.now(timezone.utc).timestamp()
+
+        record = np.zeros(1, dtype=EVENT_DTYPE)
+        record['student_id'] = student_id
+        record['camera_id'] = camera_id
+        record['timestamp'] = timestamp
+        record['score'] = score
+
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # A segment deleted since the last append is simply recreated
+            with open(self.segment_path(utc_day(timestamp)), 'ab') as f:
+                f.write(record.tobytes())
+
+    def segments(self):
+        """List (day, path) for every segment, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+
+        segments = []
+        for filename in sorted(os.listdir(self.directory)):
+            if filename.startswith(SEGMENT_PREFIX) and filename.endswith(SEGMENT_SUFFIX):
+                day = filename[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+                segments.append((day, os.path.join(self.directory, filename)))
+        return segments
+
+    def sealed_segments(self):
+        """Segments of past days that no longer receive appends"""
+        today = utc_day(datetime.now(timezone.utc).timestamp())
+        return [(day, path) for day, path in self.segments() if day < today]
+
+    @staticmethod
+    def read_segment(path):
+        """Memory-map a segment as a structured array"""
+        # Ignore a partially written trailing record after a crash
+        count = os.path.getsize(path) // EVENT_DTYPE.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=EVENT_DTYPE)
+        return np.memmap(path, dtype=EVENT_DTYPE, mode='r', shape=(count,))
+
+    def read_events(self):
+        """All events from every segment"""
+        arrays = [self.read_segment(path) for _, path in self.segments()]
+        if not arrays:
+            return np.zeros(0, dtype=EVENT_DTYPE)
+        return np.concatenate(arrays)
+
+    def remove_segment(self, path):
+        """Delete a segment after it has been compacted"""
+        with self._lock:
+            os.remove(path)
+
+    def clear(self):
+        """Delete every segment"""
+        count = 0
+        for _, path in self.segments():
+            count += len(self.read_segment(path))
+            self.remove_segment(path)
+        return count
+
+
+def aggregate_events(events):
+    """Collapse events into one row per (student, camera, day).
+
+    Returns a list of (student_id, camera_id, day, first_seen, last_seen,
+    hits, best_score) with timestamps as unix seconds.
+    """
+    if len(events) == 0:
+        return []
+
+    days = (events['timestamp'] // 86400).astype(np.int64)
+    keys = np.stack([events['student_id'].astype(np.int64),
+                     events['camera_id'].astype(np.int64), days], axis=1)
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    groups = len(unique_keys)
+
+    first_seen = np.full(groups, np.inf)
+    last_seen = np.full(groups, -np.inf)
+    best_score = np.full(groups, -np.inf)
+    np.minimum.at(first_seen, inverse, events['timestamp'])
+    np.maximum.at(last_seen, inverse, events['timestamp'])
+    np.maximum.at(best_score, inverse, events['score'].astype(np.float64))
+    hits = np.bincount(inverse, minlength=groups)
+
+    rows = []
+    for i, (student_id, camera_id, _) in enumerate(unique_keys):
+        rows.append((int(student_id), int(camera_id), utc_day(first_seen[i]),
+                     float(first_seen[i]), float(last_seen[i]), int(hits[i]),
+                     float(best_score[i])))
+    return rows
+
+
+def main():
+    from database import StudentDatabase
+
+    parser = argparse.ArgumentParser(description="Attendance event log maintenance")
+    parser.add_argument('command', choices=['compact', 'stats'])
+    parser.add_argument('--db', default="student_database.db")
+    parser.add_argument('--events-dir', default="attendance_events")
+    args = parser.parse_args()
+
+    db = StudentDatabase(args.db, events_dir=args.events_dir)
+    if args.command == 'compact':
+        compacted = db.compact_events()
+        print(f"Compacted {compacted} events into daily aggregates")
+    else:
+        for day, path in db.event_log.segments():
+            print(f"{day}: {len(db.event_log.read_segment(path))} events ({os.path.getsize(path)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
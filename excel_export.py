@@ -1,4 +1,3 @@
-import pandas as pd
 from datetime import datetime
 import os
 from database import StudentDatabase
@@ -9,6 +8,9 @@ class ExcelExporter:
     
     def export_attendance_to_excel(self, filename=None):
         """Export attendance records to Excel file"""
+        # Imported lazily so the GUI starts without pandas
+        import pandas as pd
+        
         if filename is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"attendance_records_{timestamp}.xlsx"
@@ -52,6 +54,8 @@ class ExcelExporter:
     
     def export_daily_attendance(self, date=None):
         """Export attendance for a specific date"""
+        import pandas as pd
+        
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
         
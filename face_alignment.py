@@ -0,0 +1,121 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# Canonical 5-point template (left eye, right eye, nose, left mouth corner,
+# right mouth corner) defined on a 112x112 crop
+_REFERENCE_POINTS_112 = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041],
+], dtype=np.float64)
+
+KEYPOINT_NAMES = ('left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right')
+
+
+def canonical_template(size=160, margin=0.2):
+    """Return the 5-point template scaled to a size x size crop.
+
+    margin shrinks the template towards the crop centre so the aligned crop
+    keeps some forehead and chin, closer to the loose crops FaceNet was
+    trained on.
+    """
+    points = _REFERENCE_POINTS_112 * (size / 112.0)
+    center = np.array([size / 2.0, size / 2.0])
+    return center + (points - center) * (1.0 - margin)
+
+
+def keypoints_array(faces):
+    """Stack MTCNN keypoint dicts into an (N, 5, 2) array"""
+    return np.array([[face['keypoints'][name] for name in KEYPOINT_NAMES]
+                     for face in faces], dtype=np.float64).reshape(-1, 5, 2)
+
+
+def estimate_similarity_transforms(src, dst):
+    """Least-squares similarity transforms (Umeyama) for a batch of faces.
+
+    src: (N, K, 2) detected keypoints, dst: (K, 2) template.
+    Returns (N, 2, 3) matrices mapping frame coordinates onto the template.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    num_points = src.shape[1]
+
+    src_mean = src.mean(axis=1, keepdims=True)
+    dst_mean = dst.mean(axis=0)
+    src_centered = src - src_mean
+    dst_centered = dst - dst_mean
+
+    # Per-face 2x2 covariance between template and detected points
+    covariance = np.einsum('kj,nki->nji', dst_centered, src_centered) / num_points
+    u, s, vt = np.linalg.svd(covariance)
+
+    # Guard against reflections
+    d = np.sign(np.linalg.det(u) * np.linalg.det(vt))
+    d[d == 0] = 1.0
+    correction = np.stack([np.ones_like(d), d], axis=1)
+    rotation = np.einsum('nij,nj,njk->nik', u, correction, vt)
+
+    src_var = (src_centered ** 2).sum(axis=(1, 2)) / num_points
+    src_var[src_var == 0] = 1.0
+    scale = (s * correction).sum(axis=1) / src_var
+
+    linear = rotation * scale[:, None, None]
+    translation = dst_mean - np.einsum('nij,nj->ni', linear, src_mean[:, 0, :])
+    return np.concatenate([linear, translation[:, :, None]], axis=2)
+
+
+class FaceAligner:
+    """Warp every detected face in a frame onto a canonical template in one batch"""
+
+    def __init__(self, device=None, size=160, margin=0.2):
+        self.device = device if device is not None else torch.device('cpu')
+        self.size = size
+        self.template = canonical_template(size, margin)
+
+    def sampling_grids(self, transforms, frame_shape):
+        """Convert frame->template transforms into grid_sample thetas"""
+        height, width = frame_shape[:2]
+        num_faces = transforms.shape[0]
+
+        # Homogeneous frame->template matrices, inverted to template->frame
+        forward = np.zeros((num_faces, 3, 3))
+        forward[:, :2, :] = transforms
+        forward[:, 2, 2] = 1.0
+        inverse = np.linalg.inv(forward)
+
+        # Normalised output coords [-1, 1] -> template pixels
+        half = (self.size - 1) / 2.0
+        out_to_pixels = np.array([[half, 0, half], [0, half, half], [0, 0, 1]])
+        # Frame pixels -> normalised input coords [-1, 1]
+        pixels_to_in = np.array([[2.0 / (width - 1), 0, -1],
+                                 [0, 2.0 / (height - 1), -1],
+                                 [0, 0, 1]])
+
+        theta = pixels_to_in @ inverse @ out_to_pixels
+        return torch.as_tensor(theta[:, :2, :], dtype=torch.float32, device=self.device)
+
+    def align(self, frame, keypoints):
+        """Return a normalised (N, 3, size, size) RGB tensor ready for FaceNet.
+
+        frame is the full-resolution BGR frame, keypoints an (N, 5, 2) array
+        in frame pixel coordinates.
+        """
+        keypoints = np.asarray(keypoints, dtype=np.float64).reshape(-1, 5, 2)
+        num_faces = keypoints.shape[0]
+        if num_faces == 0:
+            return torch.empty((0, 3, self.size, self.size), device=self.device)
+
+        transforms = estimate_similarity_transforms(keypoints, self.template)
+        theta = self.sampling_grids(transforms, frame.shape)
+
+        # BGR uint8 HxWx3 -> RGB float 1x3xHxW, shared by every face
+        image = torch.from_numpy(np.ascontiguousarray(frame[:, :, ::-1]))
+        image = image.to(self.device).permute(2, 0, 1).unsqueeze(0).float()
+        image = (image - 127.5) / 128.0
+
+        grid = F.affine_grid(theta, (num_faces, 3, self.size, self.size), align_corners=True)
+        return F.grid_sample(image.expand(num_faces, -1, -1, -1), grid,
+                             mode='bilinear', padding_mode='border', align_corners=True)
@@ -5,50 +5,211 @@ from mtcnn import MTCNN
 from facenet_pytorch import MTCNN as FacenetMTCNN, InceptionResnetV1
 import pickle
 import os
+import time
+from collections import OrderedDict
 from database import StudentDatabase
+from face_alignment import FaceAligner, keypoints_array
+from camera_config import load_camera_configs
+from region_detector import RegionDetector
+from frame_governor import FrameRateGovernor
+from open_set import OpenSetMatcher, learn_student_offset
+from gallery_audit import find_collisions, DUPLICATE_THRESHOLD
+from embedding_format import encode_embedding, decode_embedding, load_key, model_id_for, ModelMismatchError
+from memory_monitor import MemoryMonitor
 from datetime import datetime
 
 class FaceRecognitionSystem:
-    def __init__(self):
+    def __init__(self, use_alignment=True, camera_config=None, governor=None, record_events=False,
+                 matching_mode='open_set', storage_dtype='float32', event_bus=None, db=None,
+                 memory_monitor=None, match_threshold=0.5, match_margin=0.08):
+        # Per-phase load times reported by the startup manager
+        self.load_timings = []
+        phase_start = time.perf_counter()
+        
         # Initialize MTCNN for face detection
         self.mtcnn = MTCNN()
+        self.load_timings.append(("load detector (MTCNN)", time.perf_counter() - phase_start))
+        
+        # Camera source, regions of interest and detection scale
+        if camera_config is None:
+            configs = load_camera_configs()
+            camera_config = configs.get("default", next(iter(configs.values())))
+        self.camera_config = camera_config
+        self.detector = RegionDetector(self.mtcnn, camera_config)
+        
+        # Lowers the detection rate when the room is empty and caps CPU use
+        self.governor = governor if governor is not None else FrameRateGovernor()
         
         # Initialize FaceNet model for face recognition
+        phase_start = time.perf_counter()
         self.device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
         self.resnet = InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
+        self.load_timings.append(("load recognizer (FaceNet)", time.perf_counter() - phase_start))
+        
+        # Align faces on MTCNN keypoints before embedding
+        self.use_alignment = use_alignment
+        self.aligner = FaceAligner(device=self.device)
+        
+        # Initialize database (replay runs pass a temporary one)
+        self.db = db if db is not None else StudentDatabase()
         
-        # Initialize database
-        self.db = StudentDatabase()
+        # Embedding storage: model id (network and preprocessing) checked on
+        # load, float32/float16/int8 payloads, encrypted when
+        # FACE_EMBEDDING_KEY_FILE points at a key
+        self.model_id = model_id_for(use_alignment)
+        self.storage_dtype = storage_dtype
+        self.embedding_key = load_key()
+        
+        # 'open_set' applies per-student thresholds and a top-1/top-2 margin,
+        # 'closest' keeps the original nearest-neighbour distance test
+        self.matching_mode = matching_mode
+        # Operating point, e.g. from `evaluation.py calibrate`
+        self.matcher = OpenSetMatcher(match_threshold, match_margin)
+        
+        # Students whose stored encoding was made by another model or
+        # preprocessing (e.g. crop-era rows when aligning); never matched
+        self.outdated_enrollments = []
         
         # Load known faces
+        phase_start = time.perf_counter()
         self.known_faces = {}
         self.known_encodings = []
         self.known_names = []
         self.known_enrollments = []
         self.load_known_faces()
+        self.load_timings.append(("load gallery", time.perf_counter() - phase_start))
+        
+        # Track recent attendance to prevent duplicates, oldest mark first
+        self.recent_attendance = OrderedDict()
+        # Seconds before a student can be marked again
+        self.attendance_window = 30
+        
+        # Reason the last enrollment was refused, shown by the GUI
+        self.enrollment_error = None
+        
+        # Write attendance to the compact event log instead of attendance rows
+        self.record_events = record_events
         
-        # Track recent attendance to prevent duplicates
-        self.recent_attendance = {}
+        # Optional AttendanceEventBus; when set, attendance is stored by its sinks
+        self.event_bus = event_bus
+        
+        # Bounds recent_attendance and enforces memory budgets from the loop
+        self.memory_monitor = memory_monitor if memory_monitor is not None else MemoryMonitor()
+    
+    def warm_up(self):
+        """Run one dummy inference through every stage so the first real frame is not slow"""
+        # The camera's frame size, so P-Net sees the same pyramid shapes as live frames
+        width, height = self.camera_config.frame_size
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.detector.detect_faces(frame)
+        
+        # A blank frame yields no P-Net candidates, so R-Net and O-Net never
+        # run above; call them directly on dummy crops. Keras traces a single
+        # crop and larger batches separately, so warm both
+        for batch in (1, 2):
+            self.mtcnn._rnet.predict(np.zeros((batch, 24, 24, 3), dtype=np.float32))
+            self.mtcnn._onet.predict(np.zeros((batch, 48, 48, 3), dtype=np.float32))
+        
+        x, y = width // 2, height // 2
+        face = {
+            'box': [x - 50, y - 50, 100, 120],
+            'confidence': 1.0,
+            'keypoints': {
+                'left_eye': (x - 25, y - 5), 'right_eye': (x + 25, y - 5), 'nose': (x, y + 25),
+                'mouth_left': (x - 20, y + 50), 'mouth_right': (x + 20, y + 50)
+            }
+        }
+        encodings = self.embed_faces(frame, [face])
+        self.matcher.match(encodings)
     
     def load_known_faces(self):
         """Load known faces from database"""
+        self.clear_known_faces()
+        self.outdated_enrollments = []
         students = self.db.get_all_students()
+        offsets = self.db.get_student_offsets()
+        
+        # Per-pose templates grouped by student
+        templates = {}
+        for _, student_id, template in self.db.get_face_templates():
+            try:
+                decoded = decode_embedding(template, self.embedding_key, self.model_id)
+            except ValueError:
+                # Reported with the student's encoding below
+                continue
+            templates.setdefault(student_id, []).append(decoded)
+        
         for student in students:
             student_id, name, enrollment, face_encoding = student
             if face_encoding:
                 # Convert blob back to numpy array
-                encoding = np.frombuffer(face_encoding, dtype=np.float32)
+                try:
+                    encoding = decode_embedding(face_encoding, self.embedding_key, self.model_id)
+                except ModelMismatchError:
+                    self.outdated_enrollments.append((name, enrollment))
+                    continue
+                except ValueError as e:
+                    print(f"Skipping {name} ({enrollment}): {e}")
+                    continue
                 self.known_encodings.append(encoding)
                 self.known_names.append(name)
                 self.known_enrollments.append(enrollment)
                 self.known_faces[enrollment] = {
                     'name': name,
                     'encoding': encoding,
-                    'id': student_id
+                    'id': student_id,
+                    'offset': offsets.get(student_id),
+                    # Students enrolled before multi-template storage only have the centroid
+                    'templates': templates.get(student_id, [encoding])
                 }
+        self.refresh_matcher()
+        
+        warning = self.outdated_enrollment_warning()
+        if warning:
+            print(f"Warning: {warning}")
+    
+    def outdated_enrollment_warning(self):
+        """Explain which students cannot be recognised with the current model, or None"""
+        if not self.outdated_enrollments:
+            return None
+        names = ", ".join(f"{name} ({enrollment})" for name, enrollment in self.outdated_enrollments[:10])
+        if len(self.outdated_enrollments) > 10:
+            names += f" and {len(self.outdated_enrollments) - 10} more"
+        hint = "start with --no-alignment to keep matching them" if self.use_alignment else "start with alignment on"
+        return (f"{len(self.outdated_enrollments)} students were enrolled with a different model or "
+                f"preprocessing than {self.model_id} and will not be recognised: {names}. "
+                f"Re-enroll them, or {hint}.")
     
-    def capture_face(self, enrollment_number, name):
-        """Capture and enroll a new student's face with multiple angles"""
+    def clear_known_faces(self):
+        """Forget all enrolled faces"""
+        self.known_faces = {}
+        self.known_encodings = []
+        self.known_names = []
+        self.known_enrollments = []
+        self.refresh_matcher()
+    
+    def refresh_matcher(self):
+        """Rebuild the open-set gallery from the known faces"""
+        faces = [self.known_faces[enrollment] for enrollment in self.known_enrollments]
+        self.matcher.fit([np.stack(face['templates']) for face in faces],
+                         [face['offset'] for face in faces])
+    
+    def check_enrollment_collision(self, encoding, threshold=DUPLICATE_THRESHOLD):
+        """Enrolled students whose face matches encoding, as (name, enrollment, similarity)"""
+        indices, scores = find_collisions(encoding, self.matcher.gallery.centroids, threshold)
+        return [(self.known_names[i], self.known_enrollments[i], float(score))
+                for i, score in zip(indices, scores)]
+    
+    def capture_face(self, enrollment_number, name, allow_duplicate=False, confirm_duplicate=None):
+        """Capture and enroll a new student's face with multiple angles.
+        
+        Students listed in outdated_enrollments are re-enrolled in place. A
+        face matching another student is refused unless allow_duplicate is
+        set or confirm_duplicate(name, enrollment, similarity) returns True,
+        e.g. for twins.
+        """
+        self.enrollment_error = None
+        reenroll = enrollment_number in [enrollment for _, enrollment in self.outdated_enrollments]
         cap = cv2.VideoCapture(0)
         print(f"Capturing face for {name} ({enrollment_number})")
         print("Instructions:")
@@ -58,6 +219,8 @@ class FaceRecognitionSystem:
         print("4. Press ENTER when done, ESC to cancel")
         
         captured_encodings = []
+        # One template per SPACE press, keeping the straight/left/right poses
+        pose_templates = []
         capture_count = 0
         
         while True:
@@ -70,25 +233,18 @@ class FaceRecognitionSystem:
             
             # Draw rectangle around detected face
             if faces:
-                for face in faces:
+                confident_faces = [face for face in faces if face['confidence'] > 0.8]
+                
+                # Generate face encodings from the clean frame before drawing on it
+                encodings = self.embed_faces(frame, confident_faces)
+                captured_encodings.extend(encodings)
+                
+                for face in confident_faces:
                     x, y, w, h = face['box']
                     confidence = face['confidence']
-                    
-                    if confidence > 0.8:  # Lowered confidence threshold
-                        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                        cv2.putText(frame, f"Confidence: {confidence:.2f}", 
-                                  (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                        
-                        # Extract face region
-                        face_img = frame[y:y+h, x:x+w]
-                        
-                        # Generate face encoding
-                        face_tensor = self.preprocess_face(face_img)
-                        if face_tensor is not None:
-                            with torch.no_grad():
-                                face_encoding = self.resnet(face_tensor).cpu().numpy()
-                            
-                            captured_encodings.append(face_encoding.flatten())
+                    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+                    cv2.putText(frame, f"Confidence: {confidence:.2f}", 
+                              (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
             
             cv2.putText(frame, f"Captures: {capture_count}/3", 
                        (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
@@ -100,6 +256,7 @@ class FaceRecognitionSystem:
             if key == ord(' '):  # Space to capture
                 if faces and faces[0]['confidence'] > 0.8 and len(captured_encodings) > capture_count:
                     capture_count += 1
+                    pose_templates.append(captured_encodings[-1])
                     print(f"Capture {capture_count}/3 completed")
             elif key == 13:  # Enter to finish
                 if capture_count >= 1:  # At least one capture
@@ -113,11 +270,45 @@ class FaceRecognitionSystem:
         if captured_encodings:
             avg_encoding = np.mean(captured_encodings, axis=0)
             
+            # Refuse to enroll a face that is already in the gallery under another number
+            collisions = self.check_enrollment_collision(avg_encoding)
+            if collisions and not allow_duplicate:
+                other_name, other_enrollment, similarity = collisions[0]
+                if confirm_duplicate is not None:
+                    # Close the capture window so the dialog is not hidden behind it
+                    cap.release()
+                    cv2.destroyAllWindows()
+                    allow_duplicate = confirm_duplicate(other_name, other_enrollment, similarity)
+            if collisions and not allow_duplicate:
+                other_name, other_enrollment, similarity = collisions[0]
+                self.enrollment_error = (f"This face is already enrolled as {other_name} "
+                                         f"({other_enrollment}), similarity {similarity:.2f}")
+                print(self.enrollment_error)
+                cap.release()
+                cv2.destroyAllWindows()
+                return False
+            
+            # Per-student acceptance threshold from the spread of the SPACE
+            # captures; consecutive video frames are near-identical and would
+            # pin every student to the upper clamp
+            match_offset = learn_student_offset(pose_templates, self.matcher.threshold)
+            
             # Save to database
-            encoding_blob = avg_encoding.tobytes()
-            success = self.db.add_student(name, enrollment_number, encoding_blob)
+            encoding_blob = encode_embedding(avg_encoding, self.model_id, self.storage_dtype,
+                                             key=self.embedding_key)
+            template_blobs = [encode_embedding(template, self.model_id, self.storage_dtype,
+                                               key=self.embedding_key)
+                              for template in pose_templates]
+            if reenroll:
+                success = self.db.replace_student_face(enrollment_number, encoding_blob, match_offset,
+                                                       template_blobs)
+            else:
+                success = self.db.add_student(name, enrollment_number, encoding_blob, match_offset,
+                                              template_blobs)
             
             if success:
+                self.outdated_enrollments = [student for student in self.outdated_enrollments
+                                             if student[1] != enrollment_number]
                 print(f"Successfully enrolled {name} with {capture_count} captures")
                 # Update known faces
                 self.known_encodings.append(avg_encoding)
@@ -126,8 +317,11 @@ class FaceRecognitionSystem:
                 self.known_faces[enrollment_number] = {
                     'name': name,
                     'encoding': avg_encoding,
-                    'id': len(self.known_faces) + 1
+                    'id': self.db.get_student_by_enrollment(enrollment_number)[0],
+                    'offset': match_offset,
+                    'templates': pose_templates or [avg_encoding]
                 }
+                self.refresh_matcher()
                 cap.release()
                 cv2.destroyAllWindows()
                 return True
@@ -152,8 +346,59 @@ class FaceRecognitionSystem:
             print(f"Error preprocessing face: {e}")
             return None
     
+    def embed_faces(self, frame, faces):
+        """Generate encodings for all faces in a frame with one forward pass"""
+        if not faces:
+            return []
+        
+        if self.use_alignment and all('keypoints' in face for face in faces):
+            # Warp every face onto the canonical template in one batch
+            face_batch = self.aligner.align(frame, keypoints_array(faces))
+        else:
+            face_tensors = []
+            for face in faces:
+                x, y, w, h = face['box']
+                x, y = max(x, 0), max(y, 0)
+                face_tensor = self.preprocess_face(frame[y:y+h, x:x+w])
+                if face_tensor is None:
+                    return []
+                face_tensors.append(face_tensor)
+            face_batch = torch.cat(face_tensors)
+        
+        with torch.no_grad():
+            encodings = self.resnet(face_batch).cpu().numpy()
+        return list(encodings)
+    
+    def recognize_faces(self, face_encodings):
+        """Recognize a batch of encodings, returning (name, enrollment, id, score) each"""
+        if self.matching_mode != 'open_set':
+            results = []
+            for face_encoding in face_encodings:
+                name, enrollment, student_id = self.recognize_face(face_encoding)
+                score = 0.0
+                if name != "Unknown":
+                    face_norm = face_encoding.flatten() / np.linalg.norm(face_encoding.flatten())
+                    known_encoding = self.known_faces[enrollment]['encoding']
+                    score = float(np.dot(face_norm, known_encoding / np.linalg.norm(known_encoding)))
+                results.append((name, enrollment, student_id, score))
+            return results
+        
+        indices, scores, _ = self.matcher.match(face_encodings)
+        results = []
+        for index, score in zip(indices, scores):
+            if index < 0:
+                results.append(("Unknown", "Unknown", None, float(score)))
+            else:
+                enrollment = self.known_enrollments[index]
+                results.append((self.known_names[index], enrollment,
+                                self.known_faces[enrollment]['id'], float(score)))
+        return results
+    
     def recognize_face(self, face_encoding, threshold=1.2):
         """Recognize a face from encoding with improved tolerance"""
+        if self.matching_mode == 'open_set':
+            return self.recognize_faces([face_encoding])[0][:3]
+        
         if len(self.known_encodings) == 0:
             return "Unknown", "Unknown", None
         
@@ -178,93 +423,148 @@ class FaceRecognitionSystem:
         else:
             return "Unknown", "Unknown", None
     
-    def detect_and_recognize(self):
-        """Main function for real-time face detection and recognition"""
-        cap = cv2.VideoCapture(0)
+    def record_attendance(self, student_id, name, enrollment, score):
+        """Store an attendance mark in the event log or the attendance table"""
+        if self.event_bus is not None:
+            self.event_bus.publish('attendance', student_id=student_id, name=name,
+                                   enrollment=enrollment, score=score,
+                                   camera_id=self.camera_config.camera_number)
+        elif self.record_events:
+            self.db.record_event(student_id, self.camera_config.camera_number, score)
+        else:
+            self.db.mark_attendance(student_id, name, enrollment)
+    
+    def process_frame(self, frame):
+        """Detect, recognize and mark attendance for all faces in one frame"""
+        # Detect faces using MTCNN on the configured regions of interest;
+        # boxes and keypoints come back in full-resolution coordinates
+        faces = self.detector.detect_faces(frame)
+        
+        # Lowered confidence threshold for better detection
+        faces = [face for face in faces if face['confidence'] > 0.8]
+        
+        # Generate all face encodings in one batch before drawing on the frame
+        encodings = self.embed_faces(frame, faces)
+        
+        # Display current time at the top of the screen
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cv2.putText(frame, f"System Time: {current_time}", (10, 30), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        
+        # Recognize all faces in one vectorized pass
+        matches = self.recognize_faces(encodings)
+        
+        results = []
+        for face, (name, enrollment, student_id, confidence_score) in zip(faces, matches):
+            x, y, w, h = face['box']
+            
+            if self.event_bus is not None:
+                self.event_bus.publish('recognition', student_id=student_id, name=name,
+                                       enrollment=enrollment, score=confidence_score,
+                                       camera_id=self.camera_config.camera_number)
+            
+            # Calculate confidence score for display
+            if name != "Unknown":
+                confidence_percent = int(confidence_score * 100)
+            else:
+                confidence_percent = 0
+            
+            # Draw rectangle and label
+            color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
+            cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+            
+            label = f"{name} ({enrollment})" if name != "Unknown" else "Unknown"
+            cv2.putText(frame, label, (x, y-10), 
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+            
+            # Display confidence score
+            if name != "Unknown":
+                cv2.putText(frame, f"Confidence: {confidence_percent}%", (x, y+h+10), 
+                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+            
+            # Mark attendance if recognized (prevent duplicates within 30 seconds)
+            marked = False
+            if name != "Unknown" and student_id:
+                current_time = datetime.now()
+                student_key = f"{enrollment}_{name}"
+                
+                # Check if attendance was already marked recently
+                if student_key not in self.recent_attendance or \
+                   (current_time - self.recent_attendance[student_key]).total_seconds() > self.attendance_window:
+                    
+                    self.record_attendance(student_id, name, enrollment, confidence_score)
+                    self.recent_attendance[student_key] = current_time
+                    self.recent_attendance.move_to_end(student_key)
+                    marked = True
+                    
+                    time_str = current_time.strftime("%Y-%m-%d %H:%M:%S")
+                    cv2.putText(frame, "Attendance Marked!", (x, y+h+20), 
+                              cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+                    cv2.putText(frame, f"Time: {time_str}", (x, y+h+40), 
+                              cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+                else:
+                    cv2.putText(frame, "Already Marked", (x, y+h+20), 
+                              cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 2)
+            
+            results.append({
+                'box': face['box'],
+                'name': name,
+                'enrollment': enrollment,
+                'student_id': student_id,
+                'confidence': confidence_percent,
+                'marked': marked
+            })
+        
+        return results
+    
+    def detect_and_recognize(self, capture=None, headless=False, max_frames=None, on_results=None):
+        """Main function for real-time face detection and recognition.
+        
+        capture replaces the configured camera (e.g. a replay.ReplaySource),
+        headless runs without a window, and on_results is called with the
+        results of every processed frame.
+        """
+        cap = capture if capture is not None else cv2.VideoCapture(self.camera_config.source)
+        # Keep only the newest frame so idle-mode reads are not stale
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         print("Starting face recognition system...")
-        print("Press 'q' to quit")
+        if not headless:
+            print("Press 'q' to quit")
         
-        while True:
+        frames = 0
+        while max_frames is None or frames < max_frames:
             ret, frame = cap.read()
             if not ret:
+                # A finished replay closes itself; a live camera is retried
+                if not cap.isOpened():
+                    break
                 continue
+            frames += 1
             
-            # Detect faces using MTCNN
-            faces = self.mtcnn.detect_faces(frame)
+            if self.governor.should_detect(frame):
+                results = self.process_frame(frame)
+                self.governor.record_detection(len(results) > 0)
+                if on_results is not None:
+                    on_results(results)
             
-            # Display current time at the top of the screen
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            cv2.putText(frame, f"System Time: {current_time}", (10, 30), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            self.memory_monitor.tick(self)
             
-            for face in faces:
-                x, y, w, h = face['box']
-                confidence = face['confidence']
-                
-                if confidence > 0.8:  # Lowered confidence threshold for better detection
-                    # Extract face region
-                    face_img = frame[y:y+h, x:x+w]
-                    
-                    # Generate face encoding
-                    face_tensor = self.preprocess_face(face_img)
-                    if face_tensor is not None:
-                        with torch.no_grad():
-                            face_encoding = self.resnet(face_tensor).cpu().numpy()
-                        
-                        # Recognize face
-                        name, enrollment, student_id = self.recognize_face(face_encoding)
-                        
-                        # Calculate confidence score for display
-                        if name != "Unknown":
-                            # Get the confidence score
-                            face_norm = face_encoding.flatten() / np.linalg.norm(face_encoding.flatten())
-                            known_encoding = self.known_faces[enrollment]['encoding']
-                            known_norm = known_encoding / np.linalg.norm(known_encoding)
-                            confidence_score = np.dot(face_norm, known_norm)
-                            confidence_percent = int(confidence_score * 100)
-                        else:
-                            confidence_percent = 0
-                        
-                        # Draw rectangle and label
-                        color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
-                        cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
-                        
-                        label = f"{name} ({enrollment})" if name != "Unknown" else "Unknown"
-                        cv2.putText(frame, label, (x, y-10), 
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-                        
-                        # Display confidence score
-                        if name != "Unknown":
-                            cv2.putText(frame, f"Confidence: {confidence_percent}%", (x, y+h+10), 
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-                        
-                        # Mark attendance if recognized (prevent duplicates within 30 seconds)
-                        if name != "Unknown" and student_id:
-                            current_time = datetime.now()
-                            student_key = f"{enrollment}_{name}"
-                            
-                            # Check if attendance was already marked recently
-                            if student_key not in self.recent_attendance or \
-                               (current_time - self.recent_attendance[student_key]).seconds > 30:
-                                
-                                self.db.mark_attendance(student_id, name, enrollment)
-                                self.recent_attendance[student_key] = current_time
-                                
-                                time_str = current_time.strftime("%Y-%m-%d %H:%M:%S")
-                                cv2.putText(frame, "Attendance Marked!", (x, y+h+20), 
-                                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                                cv2.putText(frame, f"Time: {time_str}", (x, y+h+40), 
-                                          cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
-                            else:
-                                cv2.putText(frame, "Already Marked", (x, y+h+20), 
-                                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 2)
+            if headless:
+                delay = self.governor.next_delay()
+                if delay > 0:
+                    time.sleep(delay)
+                continue
             
+            status = self.governor.status()
+            cv2.putText(frame, f"Mode: {status['mode']} ({status['effective_fps']:.1f} FPS)", 
+                       (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
             cv2.imshow('Face Recognition Attendance System', frame)
             
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            # Wait out the governor's delay inside the GUI event loop
+            delay_ms = max(1, int(self.governor.next_delay() * 1000))
+            if cv2.waitKey(delay_ms) & 0xFF == ord('q'):
                 break
         
         cap.release()
-        cv2.destroyAllWindows()
-
-
+        if not headless:
+            cv2.destroyAllWindows()
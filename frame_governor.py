@@ -0,0 +1,131 @@
+import time
+from collections import deque
+import cv2
+
+
+class FrameRateGovernor:
+    """Adapt the detection rate to room activity while keeping CPU use under a budget.
+
+    In ``active`` mode every loop iteration runs detection at up to
+    ``active_fps``. After ``idle_after`` seconds without faces or motion the
+    governor drops to ``idle`` mode: frames are only checked for motion at
+    ``motion_fps`` and full detection runs at ``idle_fps``. Motion or a
+    detected face switches straight back to ``active``.
+
+    ``cpu_budget`` is process-wide: it is measured with time.process_time(),
+    so CPU used by the GUI, the event bus, report builds or backups also
+    counts and slows detection down. None disables the budget.
+    """
+
+    ACTIVE = 'active'
+    IDLE = 'idle'
+
+    def __init__(self, active_fps=15.0, idle_fps=1.0, motion_fps=5.0, idle_after=10.0,
+                 cpu_budget=0.5, motion_threshold=25, motion_area=0.01, motion_width=160,
+                 fps_window=10.0):
+        self.active_fps = active_fps
+        self.idle_fps = idle_fps
+        self.motion_fps = motion_fps
+        self.idle_after = idle_after
+        # Fraction of one core the whole process may use on average, or None
+        self.cpu_budget = cpu_budget
+        # Pixel intensity change and fraction of changed pixels that count as motion
+        self.motion_threshold = motion_threshold
+        self.motion_area = motion_area
+        self.motion_width = motion_width
+        # Seconds of history used for the effective FPS
+        self.fps_window = fps_window
+
+        self.mode = self.ACTIVE
+        self.cpu_load = 0.0
+        now = time.perf_counter()
+        self._last_activity = now
+        self._last_detection = 0.0
+        self._previous_gray = None
+        self._detections = deque()
+        self._mark_wall = now
+        self._mark_cpu = time.process_time()
+        self._last_delay = 0.0
+
+    def detect_motion(self, frame):
+        """Cheap frame-difference motion check on a small grayscale copy"""
+        height, width = frame.shape[:2]
+        scale = self.motion_width / float(width)
+        small = cv2.resize(frame, (self.motion_width, max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        previous, self._previous_gray = self._previous_gray, gray
+        if previous is None:
+            return True
+
+        changed = cv2.absdiff(gray, previous) > self.motion_threshold
+        return changed.mean() > self.motion_area
+
+    def should_detect(self, frame):
+        """Decide whether the current frame gets full detection"""
+        now = time.perf_counter()
+        if self.detect_motion(frame):
+            self._last_activity = now
+            self.mode = self.ACTIVE
+        elif now - self._last_activity > self.idle_after:
+            self.mode = self.IDLE
+
+        if self.mode == self.ACTIVE:
+            return True
+        return now - self._last_detection >= 1.0 / self.idle_fps
+
+    def record_detection(self, faces_found):
+        """Register a finished detection pass"""
+        now = time.perf_counter()
+        self._last_detection = now
+        self._detections.append(now)
+        self._trim_detections(now)
+        if faces_found:
+            self._last_activity = now
+            self.mode = self.ACTIVE
+
+    def next_delay(self):
+        """Seconds to wait before reading the next frame"""
+        now_wall = time.perf_counter()
+        now_cpu = time.process_time()
+        cpu = now_cpu - self._mark_cpu
+        wall = max(now_wall - self._mark_wall, 1e-6)
+        self.cpu_load = 0.8 * self.cpu_load + 0.2 * (cpu / wall)
+
+        # Stretch the iteration so its CPU time stays within the budget
+        work_wall = max(wall - self._last_delay, 0.0)
+        budget_delay = max(0.0, cpu / self.cpu_budget - work_wall) if self.cpu_budget else 0.0
+
+        # Hold the loop at the target rate for the current mode
+        loop_fps = self.active_fps if self.mode == self.ACTIVE else self.motion_fps
+        rate_delay = max(0.0, 1.0 / loop_fps - work_wall)
+
+        delay = max(budget_delay, rate_delay)
+        self._mark_wall = now_wall
+        self._mark_cpu = now_cpu
+        self._last_delay = delay
+        return delay
+
+    def _trim_detections(self, now):
+        while self._detections and now - self._detections[0] > self.fps_window:
+            self._detections.popleft()
+
+    @property
+    def effective_fps(self):
+        """Detection passes per second over the recent window"""
+        now = time.perf_counter()
+        self._trim_detections(now)
+        if len(self._detections) < 2:
+            return 0.0
+        # Measure up to now so the rate decays while detection is paused
+        span = now - self._detections[0]
+        return (len(self._detections) - 1) / span if span > 0 else 0.0
+
+    def status(self):
+        """Current mode, effective detection rate and CPU load"""
+        return {
+            'mode': self.mode,
+            'effective_fps': self.effective_fps,
+            'cpu_load': self.cpu_load
+        }
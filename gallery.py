@@ -0,0 +1,126 @@
+import numpy as np
+
+
+def normalize_rows(encodings):
+    """L2-normalise a stack of encodings"""
+    encodings = np.asarray(encodings, dtype=np.float32)
+    if encodings.ndim == 1:
+        encodings = encodings.reshape(1, -1)
+    norms = np.linalg.norm(encodings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return encodings / norms
+
+
+class FaceGallery:
+    """Several normalised templates per student plus a centroid matrix for fast matching.
+
+    Matching runs in two stages: a coarse pass scores every query against
+    the (S, D) centroid matrix and keeps a shortlist of students, then the
+    shortlisted students' templates are rescored exactly and each student
+    gets its best template score. The cost stays close to single-template
+    matching while keeping the pose variation of multi-template matching.
+    """
+
+    def __init__(self, shortlist=8):
+        self.shortlist = shortlist
+        self.dimension = 0
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        # (S, M, D) templates padded to the largest per-student count
+        self.padded = np.zeros((0, 0, 0), dtype=np.float32)
+        self.mask = np.zeros((0, 0), dtype=bool)
+        self.template_counts = np.zeros(0, dtype=int)
+
+    def __len__(self):
+        return self.centroids.shape[0]
+
+    def build(self, student_templates):
+        """Index a list with one (n_i, D) template array (or a single vector) per student"""
+        if len(student_templates) == 0:
+            self.__init__(self.shortlist)
+            return self
+
+        templates = [normalize_rows(t) for t in student_templates]
+        self.template_counts = np.array([t.shape[0] for t in templates])
+        self.dimension = templates[0].shape[1]
+
+        centroids = np.stack([t.mean(axis=0) for t in templates])
+        self.centroids = normalize_rows(centroids)
+
+        max_templates = int(self.template_counts.max())
+        self.padded = np.zeros((len(templates), max_templates, self.dimension), dtype=np.float32)
+        self.mask = np.zeros((len(templates), max_templates), dtype=bool)
+        for i, t in enumerate(templates):
+            self.padded[i, :t.shape[0]] = t
+            self.mask[i, :t.shape[0]] = True
+        return self
+
+    @staticmethod
+    def _top_k(scores, k):
+        """Column indices and values of the k best entries per row, best first"""
+        k = min(k, scores.shape[1])
+        if k < scores.shape[1]:
+            indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            indices = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        values = np.take_along_axis(scores, indices, axis=1)
+        order = np.argsort(-values, axis=1)
+        return np.take_along_axis(indices, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+    def match(self, queries, k=2):
+        """Two-stage match: centroid shortlist, then exact template rescoring.
+
+        Returns (Q, k) student indices and best-template scores, best first.
+        """
+        queries = normalize_rows(queries)
+
+        # Stage 1: coarse scores against every centroid
+        coarse = queries @ self.centroids.T
+        candidates, _ = self._top_k(coarse, max(self.shortlist, k))
+
+        # Stage 2: exact scores over the shortlisted students' templates
+        num_queries, num_candidates = candidates.shape
+        candidate_templates = self.padded[candidates].reshape(num_queries, -1, self.dimension)
+        exact = np.matmul(candidate_templates, queries[:, :, None]).reshape(num_queries, num_candidates, -1)
+        exact = np.where(self.mask[candidates], exact, -np.inf).max(axis=2)
+
+        order, scores = self._top_k(exact, k)
+        return np.take_along_axis(candidates, order, axis=1), scores
+
+    def match_exhaustive(self, queries, k=2):
+        """Score every template of every student (reference for the two-stage match)"""
+        queries = normalize_rows(queries)
+        all_templates = self.padded.reshape(-1, self.dimension)
+        exact = (queries @ all_templates.T).reshape(queries.shape[0], len(self), -1)
+        exact = np.where(self.mask[None, :, :], exact, -np.inf).max(axis=2)
+        return self._top_k(exact, k)
+
+    def match_centroids(self, queries, k=2):
+        """Score only the centroids (single-template matching)"""
+        return self._top_k(normalize_rows(queries) @ self.centroids.T, k)
+
+
+def synthetic_gallery(students, templates_per_student=3, dimension=512, intrinsic_dimension=24,
+                      pose_spread=1.0, seed=0):
+    """Random identities with per-pose offsets, for benchmarks and load tests.
+
+    Identities and poses are drawn in a low intrinsic_dimension subspace
+    and projected to dimension, like real face embeddings, so that
+    neighbouring students are close enough for matching to make mistakes.
+    Returns (identities, pose_offsets) with shapes (S, D) and (S, T, D).
+    """
+    rng = np.random.default_rng(seed)
+    basis = np.linalg.qr(rng.normal(size=(dimension, intrinsic_dimension)))[0].T
+    identities = normalize_rows(rng.normal(size=(students, intrinsic_dimension)) @ basis)
+    offsets = normalize_rows(rng.normal(size=(students * templates_per_student, intrinsic_dimension)))
+    pose_offsets = (offsets * pose_spread) @ basis
+    return identities, pose_offsets.reshape(students, templates_per_student, dimension).astype(np.float32)
+
+
+def synthetic_samples(identities, pose_offsets, student_indices, noise=0.4, seed=1):
+    """One noisy embedding per requested student, in a random enrolled pose"""
+    rng = np.random.default_rng(seed)
+    student_indices = np.asarray(student_indices)
+    poses = rng.integers(0, pose_offsets.shape[1], size=len(student_indices))
+    jitter = normalize_rows(rng.normal(size=(len(student_indices), identities.shape[1]))) * noise
+    samples = identities[student_indices] + pose_offsets[student_indices, poses] + jitter
+    return normalize_rows(samples)
@@ -0,0 +1,151 @@
+import argparse
+import time
+import numpy as np
+from open_set import normalize_rows
+from embedding_format import decode_embedding, load_key, blob_model_id
+
+# Cosine similarity above which two enrollments are treated as the same person
+DUPLICATE_THRESHOLD = 0.75
+# Cosine similarity above which two students can be mistaken for each other
+CONFUSABLE_THRESHOLD = 0.55
+
+
+def find_collisions(encoding, gallery, threshold=DUPLICATE_THRESHOLD):
+    """Gallery rows whose similarity to encoding reaches threshold.
+
+    gallery holds L2-normalised rows. Returns (indices, scores) sorted by
+    decreasing similarity.
+    """
+    if len(gallery) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=np.float32)
+
+    scores = gallery @ normalize_rows(encoding)[0]
+    indices = np.nonzero(scores >= threshold)[0]
+    order = np.argsort(-scores[indices])
+    return indices[order], scores[indices][order]
+
+
+def audit_gallery(encodings, threshold=CONFUSABLE_THRESHOLD, block_size=2048):
+    """All pairs of gallery rows with similarity >= threshold.
+
+    The similarity matrix is computed in block_size x block_size tiles over
+    the upper triangle, so memory stays at one tile (16 MB for 2048) no
+    matter how large the gallery is. Returns a list of (i, j, similarity)
+    sorted by decreasing similarity.
+    """
+    gallery = normalize_rows(encodings)
+    count = gallery.shape[0]
+    pairs_i, pairs_j, pairs_score = [], [], []
+
+    for row_start in range(0, count, block_size):
+        row_block = gallery[row_start:row_start + block_size]
+        for col_start in range(row_start, count, block_size):
+            col_block = gallery[col_start:col_start + block_size]
+            similarities = row_block @ col_block.T
+
+            hits = similarities >= threshold
+            if row_start == col_start:
+                # Diagonal tile: keep each pair once and skip self-matches
+                hits &= np.triu(np.ones_like(hits), k=1)
+
+            rows, cols = np.nonzero(hits)
+            pairs_i.append(rows + row_start)
+            pairs_j.append(cols + col_start)
+            pairs_score.append(similarities[rows, cols])
+
+    if not pairs_i:
+        return []
+
+    pairs_i = np.concatenate(pairs_i)
+    pairs_j = np.concatenate(pairs_j)
+    pairs_score = np.concatenate(pairs_score)
+    order = np.argsort(-pairs_score)
+    return [(int(pairs_i[k]), int(pairs_j[k]), float(pairs_score[k])) for k in order]
+
+
+def audit_students(templates, owners, threshold=CONFUSABLE_THRESHOLD, block_size=2048):
+    """Pairs of students whose best template-to-template similarity >= threshold.
+
+    templates holds one row per pose template and owners the student index
+    of each row, so the audit sees the same templates the matcher does.
+    Returns a list of (student_i, student_j, similarity) sorted by
+    decreasing similarity, one entry per pair of students.
+    """
+    owners = np.asarray(owners)
+    best = {}
+    for i, j, score in audit_gallery(templates, threshold, block_size):
+        a, b = sorted((int(owners[i]), int(owners[j])))
+        # Templates of one student always resemble each other
+        if a != b and score > best.get((a, b), -1.0):
+            best[(a, b)] = score
+    return sorted(((a, b, score) for (a, b), score in best.items()), key=lambda pair: -pair[2])
+
+
+def main():
+    from database import StudentDatabase
+
+    parser = argparse.ArgumentParser(description="Find near-duplicate and confusable students in the gallery")
+    parser.add_argument('--db', default="student_database.db")
+    parser.add_argument('--duplicate', type=float, default=DUPLICATE_THRESHOLD,
+                        help="Similarity treated as the same person enrolled twice")
+    parser.add_argument('--confusable', type=float, default=CONFUSABLE_THRESHOLD,
+                        help="Similarity at which two students risk being confused")
+    parser.add_argument('--block-size', type=int, default=2048)
+    args = parser.parse_args()
+
+    db = StudentDatabase(args.db)
+    key = load_key()
+
+    templates_by_student = {}
+    for _, student_id, blob in db.get_face_templates():
+        templates_by_student.setdefault(student_id, []).append(blob)
+
+    # Embeddings of different models are not comparable, so each model is
+    # audited on its own; unreadable rows are reported instead of aborting.
+    # Students are compared on their pose templates, falling back to the
+    # averaged encoding for students enrolled before templates were stored
+    by_model = {}
+    skipped = []
+    for student in db.get_all_students():
+        blobs = templates_by_student.get(student[0]) or ([student[3]] if student[3] else [])
+        if not blobs:
+            continue
+        try:
+            model_id = blob_model_id(blobs[0])
+            encodings = [decode_embedding(blob, key, model_id) for blob in blobs]
+        except ValueError as e:
+            skipped.append((student, e))
+            continue
+        by_model.setdefault(model_id, []).append((student, encodings))
+
+    for student, error in skipped:
+        print(f"Skipped {student[1]} ({student[2]}): {error}")
+
+    for model_id in sorted(by_model):
+        students = [student for student, _ in by_model[model_id]]
+        if len(students) < 2:
+            print(f"\n{model_id}: need at least two enrolled students to audit")
+            continue
+        templates = np.stack([encoding for _, encodings in by_model[model_id] for encoding in encodings])
+        owners = [index for index, (_, encodings) in enumerate(by_model[model_id]) for _ in encodings]
+
+        start = time.perf_counter()
+        pairs = audit_students(templates, owners, args.confusable, args.block_size)
+        elapsed = time.perf_counter() - start
+
+        duplicates = [pair for pair in pairs if pair[2] >= args.duplicate]
+        confusable = [pair for pair in pairs if pair[2] < args.duplicate]
+
+        print(f"\n{model_id}: audited {len(students)} students ({len(templates)} templates) in {elapsed:.2f}s")
+        for title, group in (("Near-duplicate identities", duplicates), ("Confusable students", confusable)):
+            print(f"\n{title}: {len(group)}")
+            for i, j, score in group:
+                print(f"  {score:.3f}  {students[i][1]} ({students[i][2]})  <->  "
+                      f"{students[j][1]} ({students[j][2]})")
+
+    if not by_model:
+        print("Need at least two enrolled students to audit")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,27 @@
+import argparse
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-import cv2
-from face_recognition_system import FaceRecognitionSystem
+from startup import StartupManager
 from excel_export import ExcelExporter
 from database import StudentDatabase
+from backup import DatabaseBackup
+from report_generator import ReportGenerator
+from event_bus import build_event_bus
+from memory_monitor import MemoryMonitor
+from frame_governor import FrameRateGovernor
+from camera_config import load_camera_configs
 import threading
 from datetime import datetime
 
 class AttendanceSystemGUI:
-    def __init__(self, root):
+    def __init__(self, root, startup=None, preload=True):
         self.root = root
         self.root.title("Face Recognition Attendance System")
         self.root.geometry("800x600")
         
-        # Initialize components
-        self.face_system = FaceRecognitionSystem()
+        # Initialize components; the vision models load in the background
+        self.startup = startup if startup is not None else StartupManager()
+        self.face_system = None
         self.excel_exporter = ExcelExporter()
         self.db = StudentDatabase()
         
@@ -24,6 +31,63 @@ class AttendanceSystemGUI:
         # Flag for recognition thread
         self.recognition_running = False
         self.recognition_thread = None
+        
+        # Weekly report built off the Tk thread: (stats, error) once done
+        self.report_thread = None
+        self.report_result = None
+        
+        # Backup taken off the Tk thread: (stats, verification, error) once done
+        self.backup_thread = None
+        self.backup_result = None
+        
+        self.startup.mark("window ready")
+        if preload:
+            self.load_models()
+    
+    def load_models(self):
+        """Start loading the vision models and poll until they are ready"""
+        if self.startup.loading or self.face_system is not None:
+            return
+        self.update_status("Loading face recognition models in the background...")
+        self.startup.start_background_load()
+        self.root.after(200, self.check_models_loaded)
+    
+    def check_models_loaded(self):
+        """Pick up the loaded models without blocking the GUI"""
+        if self.startup.loading:
+            self.root.after(200, self.check_models_loaded)
+            return
+        
+        if self.startup.error is not None:
+            self.update_status(f"Error loading face recognition models: {self.startup.error}")
+            return
+        
+        self.face_system = self.startup.face_system
+        self.update_status("Face recognition models ready.")
+        self.update_status(self.startup.report())
+        
+        warning = self.face_system.outdated_enrollment_warning()
+        if warning:
+            self.update_status(warning)
+            messagebox.showwarning("Outdated Enrollments", warning)
+    
+    def require_face_system(self):
+        """Return the face system, or start loading it and tell the user to wait"""
+        if self.face_system is not None:
+            return self.face_system
+        
+        if self.startup.error is not None:
+            # e.g. the FaceNet weights could not be downloaded
+            if messagebox.askretrycancel("Error", f"Face recognition models failed to load: "
+                                                  f"{self.startup.error}\n\nTry loading them again?"):
+                self.startup.reset()
+                self.load_models()
+            return None
+        
+        self.load_models()
+        messagebox.showinfo("Please Wait", "Face recognition models are still loading. "
+                                           "Try again in a few seconds.")
+        return None
     
     def create_widgets(self):
         """Create the main GUI widgets"""
@@ -83,6 +147,11 @@ class AttendanceSystemGUI:
                                command=self.view_attendance_summary)
         summary_btn.pack(side="left", padx=(0, 10))
         
+        # Weekly per-course report button
+        weekly_report_btn = ttk.Button(export_frame, text="Export Weekly Report", 
+                                     command=self.export_weekly_report)
+        weekly_report_btn.pack(side="left", padx=(0, 10))
+        
         # Data Management Section
         data_frame = ttk.LabelFrame(main_frame, text="Data Management", padding=10)
         data_frame.pack(fill="x", pady=(0, 10))
@@ -97,6 +166,11 @@ class AttendanceSystemGUI:
                                   command=self.delete_all_data)
         delete_all_btn.pack(side="left", padx=(0, 10))
         
+        # Backup database button
+        backup_btn = ttk.Button(data_frame, text="Backup Database", 
+                              command=self.backup_database)
+        backup_btn.pack(side="left", padx=(0, 10))
+        
         # Status Section
         status_frame = ttk.LabelFrame(main_frame, text="System Status", padding=10)
         status_frame.pack(fill="both", expand=True)
@@ -130,23 +204,53 @@ class AttendanceSystemGUI:
         if not enrollment:
             return
         
-        # Check if enrollment already exists
+        course = simpledialog.askstring("Add Student", "Enter course (optional):")
+        
+        face_system = self.require_face_system()
+        if face_system is None:
+            return
+        
+        # Check if enrollment already exists; students enrolled with an
+        # outdated model can have their face captured again
         existing = self.db.get_student_by_enrollment(enrollment)
         if existing:
-            messagebox.showerror("Error", f"Student with enrollment number {enrollment} already exists!")
-            return
+            outdated = [student for student in face_system.outdated_enrollments if student[1] == enrollment]
+            if not outdated:
+                messagebox.showerror("Error", f"Student with enrollment number {enrollment} already exists!")
+                return
+            if not messagebox.askyesno("Re-enroll Student",
+                                       f"{existing[1]} ({enrollment}) was enrolled with an outdated model "
+                                       f"and is not being recognised. Capture their face again?"):
+                return
+            name = existing[1]
         
         # Capture face
         self.update_status(f"Capturing face for {name} ({enrollment})")
-        success = self.face_system.capture_face(enrollment, name)
+        success = face_system.capture_face(enrollment, name, confirm_duplicate=self.confirm_duplicate)
         
         if success:
+            if course:
+                self.db.set_student_courses([(enrollment, course.strip())])
             messagebox.showinfo("Success", f"Student {name} added successfully!")
             self.update_status(f"Student {name} ({enrollment}) added successfully")
+        elif face_system.enrollment_error:
+            messagebox.showerror("Error", face_system.enrollment_error)
+            self.update_status(f"Failed to add student {name}: {face_system.enrollment_error}")
         else:
             messagebox.showerror("Error", "Failed to capture face. Please try again.")
             self.update_status(f"Failed to add student {name}")
     
+    def confirm_duplicate(self, other_name, other_enrollment, similarity):
+        """Ask whether to enroll a face that matches another student (e.g. twins)"""
+        message = f"This face matches {other_name} ({other_enrollment}) with similarity {similarity:.2f}."
+        face_system = self.startup.face_system
+        if face_system is not None and face_system.matching_mode == 'open_set':
+            # Near-identical students rarely clear the top-1/top-2 margin
+            message += (f"\n\nFaces this close will often be within the match margin "
+                        f"({face_system.matcher.margin:.2f}) of each other, so both students may be "
+                        f"shown as Unknown. A smaller --match-margin or --matching-mode closest avoids this.")
+        return messagebox.askyesno("Possible Duplicate", message + "\n\nEnroll anyway, e.g. for twins?")
+    
     def view_students(self):
         """View all students in the system"""
         students = self.db.get_all_students()
@@ -186,6 +290,9 @@ class AttendanceSystemGUI:
         if self.recognition_running:
             return
         
+        if self.require_face_system() is None:
+            return
+        
         self.recognition_running = True
         self.start_btn.config(state="disabled")
         self.stop_btn.config(state="normal")
@@ -206,7 +313,9 @@ class AttendanceSystemGUI:
         self.update_status("Face recognition system stopped.")
         
         # Close any open CV windows
-        cv2.destroyAllWindows()
+        if self.face_system is not None:
+            import cv2
+            cv2.destroyAllWindows()
     
     def run_recognition(self):
         """Run face recognition system"""
@@ -252,12 +361,105 @@ class AttendanceSystemGUI:
             messagebox.showinfo("Info", f"No attendance records found for {date}")
             self.update_status(f"No records found for {date}")
     
+    def export_weekly_report(self):
+        """Export a workbook with one sheet per course and day"""
+        date = simpledialog.askstring("Export Weekly Report", 
+                                    "Enter any date in the week (YYYY-MM-DD) or leave empty for this week:")
+        
+        if date is None:  # User cancelled
+            return
+        
+        if self.report_thread is not None:
+            messagebox.showinfo("Please Wait", "A weekly report is already being exported.")
+            return
+        
+        try:
+            ReportGenerator.week_start(date or None)
+        except ValueError:
+            messagebox.showerror("Error", f"Invalid date: {date}")
+            return
+        
+        self.update_status("Exporting weekly report in the background...")
+        self.report_result = None
+        self.report_thread = threading.Thread(target=self.build_weekly_report, args=(date or None,),
+                                              daemon=True)
+        self.report_thread.start()
+        self.root.after(200, self.check_weekly_report)
+    
+    def build_weekly_report(self, date):
+        """Generate the weekly report on a worker thread"""
+        try:
+            # StudentDatabase opens a connection per call, so it is safe to share
+            self.report_result = (ReportGenerator(self.db).generate_weekly_report(date), None)
+        except Exception as e:
+            self.report_result = (None, e)
+    
+    def check_weekly_report(self):
+        """Report the finished weekly export without blocking the GUI"""
+        if self.report_thread.is_alive():
+            self.root.after(200, self.check_weekly_report)
+            return
+        
+        self.report_thread = None
+        stats, error = self.report_result
+        if error is not None:
+            messagebox.showerror("Error", f"Weekly report failed: {error}")
+            self.update_status(f"Weekly report failed: {error}")
+        elif stats:
+            messagebox.showinfo("Success", f"Weekly report exported to {stats['path']}")
+            self.update_status(f"Exported weekly report to {stats['path']}: {stats['sheets']} sheets "
+                               f"({stats['rebuilt']} rebuilt, {stats['cached']} cached) "
+                               f"in {stats['seconds']:.2f}s")
+        else:
+            messagebox.showinfo("Info", "No attendance records found for that week")
+            self.update_status("No attendance records found for the weekly report")
+    
     def view_attendance_summary(self):
         """View attendance summary"""
         summary = self.excel_exporter.get_attendance_summary()
         messagebox.showinfo("Attendance Summary", summary)
         self.update_status("Viewed attendance summary")
     
+    def backup_database(self):
+        """Take an online snapshot of the database and verify it"""
+        if self.backup_thread is not None:
+            messagebox.showinfo("Please Wait", "A backup is already running.")
+            return
+        
+        self.update_status("Backing up database in the background...")
+        self.backup_result = None
+        self.backup_thread = threading.Thread(target=self.run_backup, daemon=True)
+        self.backup_thread.start()
+        self.root.after(200, self.check_backup)
+    
+    def run_backup(self):
+        """Snapshot and verify the database on a worker thread"""
+        backup = DatabaseBackup(self.db.db_path)
+        try:
+            stats = backup.snapshot()
+            self.backup_result = (stats, backup.verify(stats['path']), None)
+        except Exception as e:
+            self.backup_result = (None, None, e)
+    
+    def check_backup(self):
+        """Report the finished backup without blocking the GUI"""
+        if self.backup_thread.is_alive():
+            self.root.after(200, self.check_backup)
+            return
+        
+        self.backup_thread = None
+        stats, result, error = self.backup_result
+        if error is not None:
+            messagebox.showerror("Error", f"Backup failed: {error}")
+            self.update_status(f"Backup failed: {error}")
+        elif result['ok']:
+            messagebox.showinfo("Success", f"Database backed up to {stats['path']}")
+            self.update_status(f"Backed up database to {stats['path']} in {stats['seconds']:.2f}s "
+                               f"(verified in {result['seconds']:.2f}s)")
+        else:
+            messagebox.showerror("Error", f"Backup verification failed: {result['integrity']}")
+            self.update_status(f"Backup verification failed: {result['integrity']}")
+    
     def delete_all_attendance(self):
         """Delete all attendance records"""
         # Get current counts
@@ -279,7 +481,8 @@ class AttendanceSystemGUI:
             self.update_status(f"Deleted {deleted_count} attendance records")
             
             # Reload known faces to update the system
-            self.face_system.load_known_faces()
+            if self.face_system is not None:
+                self.face_system.load_known_faces()
     
     def delete_all_data(self):
         """Delete all students and attendance records"""
@@ -308,20 +511,73 @@ class AttendanceSystemGUI:
             self.update_status(f"Deleted all data: {students_deleted} students, {attendance_deleted} attendance records")
             
             # Clear known faces from memory
-            self.face_system.known_faces = {}
-            self.face_system.known_encodings = []
-            self.face_system.known_names = []
-            self.face_system.known_enrollments = []
-            self.face_system.recent_attendance = {}
+            if self.face_system is not None:
+                self.face_system.clear_known_faces()
+                self.face_system.recent_attendance.clear()
 
 def main():
+    parser = argparse.ArgumentParser(description="Face recognition attendance system")
+    # Keeps export/admin sessions from ever loading the models
+    parser.add_argument('--no-preload', action='store_true', help="Load the models only when first needed")
+    parser.add_argument('--no-alignment', action='store_true',
+                        help="Embed plain face crops, matching students enrolled before alignment")
+    parser.add_argument('--matching-mode', choices=['open_set', 'closest'], default='open_set',
+                        help="open_set: per-student thresholds and a margin; closest: nearest neighbour")
+    parser.add_argument('--match-threshold', type=float, default=0.5,
+                        help="Base cosine similarity to accept a match (see evaluation.py calibrate)")
+    parser.add_argument('--match-margin', type=float, default=0.08,
+                        help="Minimum similarity gap between the best and second-best student")
+    parser.add_argument('--camera', default=None,
+                        help="camera_id from cameras.json to use (default: 'default' or the first camera)")
+    parser.add_argument('--active-fps', type=float, default=15.0,
+                        help="Detection rate while faces or motion are present")
+    parser.add_argument('--idle-fps', type=float, default=1.0, help="Detection rate in an empty, still room")
+    parser.add_argument('--idle-after', type=float, default=10.0,
+                        help="Seconds without faces or motion before going idle")
+    parser.add_argument('--cpu-budget', type=float, default=0.5,
+                        help="Fraction of one core the whole process may use (0 disables the budget)")
+    parser.add_argument('--record-events', action='store_true',
+                        help="Append attendance to the compact event log instead of attendance rows")
+    parser.add_argument('--event-bus', action='store_true',
+                        help="Store attendance through the background event bus")
+    parser.add_argument('--csv-log', metavar='PATH', help="Also stream events to a CSV live log (implies --event-bus)")
+    parser.add_argument('--webhook', metavar='URL', help="Also POST events to this URL (implies --event-bus)")
+    parser.add_argument('--rss-budget-mb', type=float,
+                        help="Release freed memory when resident memory exceeds this")
+    parser.add_argument('--gallery-budget-mb', type=float,
+                        help="Match on per-student centroids only when pose templates exceed this")
+    parser.add_argument('--max-recent-attendance', type=int, default=10000,
+                        help="Cap on students remembered for the re-mark window")
+    args = parser.parse_args()
+    
+    camera_configs = load_camera_configs()
+    camera_config = None
+    if args.camera is not None:
+        if args.camera not in camera_configs:
+            parser.error(f"unknown camera '{args.camera}', available: {', '.join(sorted(camera_configs))}")
+        camera_config = camera_configs[args.camera]
+    
+    event_bus = None
+    if args.event_bus or args.csv_log or args.webhook:
+        event_bus = build_event_bus(StudentDatabase(), args.record_events, args.csv_log, args.webhook)
+    
+    memory_monitor = MemoryMonitor(args.rss_budget_mb, args.gallery_budget_mb, args.max_recent_attendance)
+    governor = FrameRateGovernor(active_fps=args.active_fps, idle_fps=args.idle_fps, idle_after=args.idle_after,
+                                 cpu_budget=args.cpu_budget or None)
+    startup = StartupManager({'use_alignment': not args.no_alignment, 'record_events': args.record_events,
+                              'event_bus': event_bus, 'memory_monitor': memory_monitor, 'governor': governor,
+                              'matching_mode': args.matching_mode, 'match_threshold': args.match_threshold,
+                              'match_margin': args.match_margin, 'camera_config': camera_config})
     root = tk.Tk()
-    app = AttendanceSystemGUI(root)
+    app = AttendanceSystemGUI(root, startup, preload=not args.no_preload)
     
     # Handle window close
     def on_closing():
         if app.recognition_running:
             app.stop_recognition()
+        if event_bus is not None:
+            # Flush buffered attendance before exiting
+            event_bus.stop()
         root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
@@ -0,0 +1,367 @@
+import argparse
+import ctypes
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime
+import numpy as np
+
+MB = 1024 * 1024
+
+
+def _windows_working_set():
+    """Working set of this process from GetProcessMemoryInfo, None if unavailable"""
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+    try:
+        kernel32 = ctypes.WinDLL('kernel32')
+        psapi = ctypes.WinDLL('psapi')
+    except (AttributeError, OSError):
+        return None
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters),
+                                           wintypes.DWORD]
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.WorkingSetSize
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where it cannot be measured.
+
+    Reads /proc on Linux, the working set on Windows and peak RSS elsewhere.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return _windows_working_set()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def release_free_memory():
+    """Collect garbage and hand freed heap pages back to the OS where glibc allows it"""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def array_bytes(value):
+    """Bytes held by a numpy array or torch tensor, 0 for anything else"""
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if hasattr(value, 'element_size'):
+        return value.numel() * value.element_size()
+    return 0
+
+
+def keras_weight_bytes(model):
+    # Sized from shapes and dtypes; get_weights() would copy every weight
+    return sum(int(np.prod(weight.shape)) * np.dtype(getattr(weight.dtype, 'name', weight.dtype)).itemsize
+               for weight in model.weights)
+
+
+def torch_weight_bytes(module):
+    return sum(array_bytes(tensor) for tensor in list(module.parameters()) + list(module.buffers()))
+
+
+class MemoryMonitor:
+    """Memory accounting, budgets and leak checks for the recognition loop.
+
+    footprint() sizes the gallery, caches, model weights and event queues
+    and compares them with the process RSS; whatever is left over is the
+    TensorFlow/PyTorch runtimes and the interpreter. Every interval seconds
+    tick() enforces the budgets:
+
+    - recent_attendance entries older than the re-mark window are dropped,
+      and the oldest go first once max_recent_attendance is reached
+    - a gallery over gallery_budget_mb keeps only one centroid per student
+      instead of every pose template
+    - an RSS over rss_budget_mb triggers a garbage collection and returns
+      freed heap pages to the OS
+
+    With leak_check, allocations are traced from the start and the first
+    check takes a baseline snapshot, so startup allocations are not
+    reported; later checks list the sites that grew most since then.
+    tracemalloc only sees Python and numpy allocations, not memory inside
+    TensorFlow or PyTorch.
+    """
+
+    def __init__(self, rss_budget_mb=None, gallery_budget_mb=None, max_recent_attendance=10000,
+                 interval=60.0, history=1440, leak_check=False, trace_frames=1, top=10):
+        self.rss_budget_mb = rss_budget_mb
+        self.gallery_budget_mb = gallery_budget_mb
+        self.max_recent_attendance = max_recent_attendance
+        self.interval = interval
+        self.leak_check = leak_check
+        self.trace_frames = trace_frames
+        self.top = top
+
+        self.started_at = time.perf_counter()
+        self._last_check = self.started_at
+        # (elapsed seconds, rss bytes) per check, for the growth rate
+        self.history = deque(maxlen=history)
+        self.evictions = {'recent_attendance': 0, 'gallery_templates': 0, 'rss_releases': 0}
+        # (detector, recognizer) weight bytes; weights never change, so they are sized once
+        self._weight_bytes = None
+        self._baseline = None
+        if leak_check:
+            self.start_leak_check()
+
+    def start_leak_check(self):
+        """Start tracing allocations; the next check takes the baseline"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+        self.leak_check = True
+        self._baseline = None
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+
+    def footprint(self, system):
+        """Bytes (and entry counts) held by each part of a FaceRecognitionSystem"""
+        gallery = system.matcher.gallery
+        gallery_bytes = sum(array_bytes(array) for array in
+                            (gallery.centroids, gallery.padded, gallery.mask, gallery.template_counts))
+        # Known faces share arrays between known_encodings and the per-student dicts
+        seen = set()
+        for face in system.known_faces.values():
+            for array in [face['encoding']] + list(face['templates']):
+                if id(array) not in seen:
+                    seen.add(id(array))
+                    gallery_bytes += array_bytes(array)
+
+        recent = system.recent_attendance
+        recent_bytes = sys.getsizeof(recent) + sum(sys.getsizeof(key) + sys.getsizeof(value)
+                                                   for key, value in recent.items())
+
+        governor = system.governor
+        cache_bytes = array_bytes(governor._previous_gray) + sys.getsizeof(governor._detections)
+        cache_bytes += array_bytes(system.aligner.template)
+
+        queued = 0
+        queue_bytes = 0
+        if system.event_bus is not None:
+            for state in system.event_bus.states:
+                queued += len(state.buffer)
+                queue_bytes += sum(sys.getsizeof(event) for event in state.buffer)
+
+        if self._weight_bytes is None:
+            mtcnn = system.mtcnn
+            self._weight_bytes = (sum(keras_weight_bytes(net) for net in (mtcnn._pnet, mtcnn._rnet, mtcnn._onet)),
+                                  torch_weight_bytes(system.resnet))
+        detector_bytes, recognizer_bytes = self._weight_bytes
+
+        report = {
+            'gallery': gallery_bytes,
+            'gallery_students': len(gallery),
+            'gallery_templates': int(gallery.template_counts.sum()) if len(gallery) else 0,
+            'recent_attendance': recent_bytes,
+            'recent_attendance_entries': len(recent),
+            'caches': cache_bytes,
+            'event_queues': queue_bytes,
+            'event_queue_entries': queued,
+            'detector_weights': detector_bytes,
+            'recognizer_weights': recognizer_bytes,
+            'rss': rss_bytes()
+        }
+        accounted = (gallery_bytes + recent_bytes + cache_bytes + queue_bytes + detector_bytes
+                     + recognizer_bytes)
+        report['runtime_and_other'] = max(0, report['rss'] - accounted) if report['rss'] is not None else None
+        if tracemalloc.is_tracing():
+            report['traced'] = tracemalloc.get_traced_memory()[0]
+        return report
+
+    def prune_recent_attendance(self, system, now=None):
+        """Drop re-mark entries that have expired, then the oldest beyond the cap"""
+        recent = system.recent_attendance
+        now = now if now is not None else datetime.now()
+        evicted = 0
+        # Entries are kept in marking order, so expired ones are at the front
+        while recent:
+            key, marked_at = next(iter(recent.items()))
+            if (now - marked_at).total_seconds() <= system.attendance_window and \
+               len(recent) <= self.max_recent_attendance:
+                break
+            del recent[key]
+            evicted += 1
+        self.evictions['recent_attendance'] += evicted
+        return evicted
+
+    def enforce_gallery_budget(self, system, gallery_bytes):
+        """Fall back to one centroid per student when the templates exceed the budget"""
+        if self.gallery_budget_mb is None or gallery_bytes <= self.gallery_budget_mb * MB:
+            return 0
+        evicted = 0
+        for face in system.known_faces.values():
+            if len(face['templates']) > 1:
+                evicted += len(face['templates'])
+                face['templates'] = [face['encoding']]
+        if evicted:
+            system.refresh_matcher()
+            self.evictions['gallery_templates'] += evicted
+            print(f"Gallery over its {self.gallery_budget_mb} MB budget: "
+                  f"evicted {evicted} pose templates, matching on centroids only")
+        return evicted
+
+    def enforce_rss_budget(self, rss):
+        """Release freed memory when the process is over its RSS budget"""
+        if self.rss_budget_mb is None or rss is None or rss <= self.rss_budget_mb * MB:
+            return rss
+        release_free_memory()
+        self.evictions['rss_releases'] += 1
+        after = rss_bytes()
+        if after is not None and after > self.rss_budget_mb * MB:
+            print(f"Resident memory {after / MB:.0f} MB is over the {self.rss_budget_mb} MB budget "
+                  f"after releasing {max(0, rss - after) / MB:.0f} MB")
+        return after
+
+    def growth_rate(self, min_span=300.0):
+        """Least-squares RSS growth in MB per hour, None until min_span seconds are covered"""
+        if len(self.history) < 2 or self.history[-1][0] - self.history[0][0] < min_span:
+            return None
+        times = [elapsed for elapsed, _ in self.history]
+        values = [rss for _, rss in self.history]
+        mean_t = sum(times) / len(times)
+        mean_v = sum(values) / len(values)
+        spread = sum((t - mean_t) ** 2 for t in times)
+        slope = sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values)) / spread
+        return slope * 3600 / MB
+
+    def top_growth(self, limit=None):
+        """Allocation sites that grew most since the baseline, as (site, bytes, blocks)"""
+        if self._baseline is None:
+            return []
+        differences = self._snapshot().compare_to(self._baseline, 'lineno')
+        growth = []
+        for stat in differences:
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            growth.append((f"{frame.filename}:{frame.lineno}", stat.size_diff, stat.count_diff))
+            if len(growth) >= (limit or self.top):
+                break
+        return growth
+
+    def check(self, system):
+        """Enforce every budget and record a footprint sample"""
+        self.prune_recent_attendance(system)
+        report = self.footprint(system)
+        if self.enforce_gallery_budget(system, report['gallery']):
+            report = self.footprint(system)
+        rss = self.enforce_rss_budget(report['rss'])
+        if rss is not None and report['rss'] is not None:
+            report['runtime_and_other'] = max(0, report['runtime_and_other'] - (report['rss'] - rss))
+            self.history.append((time.perf_counter() - self.started_at, rss))
+        report['rss'] = rss
+
+        report['rss_growth_mb_per_hour'] = self.growth_rate()
+        report['evictions'] = dict(self.evictions)
+        if self.leak_check:
+            if self._baseline is None:
+                self._baseline = self._snapshot()
+                report['top_growth'] = []
+            else:
+                report['top_growth'] = self.top_growth()
+        return report
+
+    def tick(self, system):
+        """Called once per loop iteration; runs check() every interval seconds"""
+        now = time.perf_counter()
+        if now - self._last_check < self.interval:
+            return None
+        self._last_check = now
+        report = self.check(system)
+        if self.leak_check:
+            print(format_report(report))
+        return report
+
+
+def format_report(report):
+    """Human-readable footprint report"""
+    if report['rss'] is None:
+        resident = "Resident memory: unavailable on this platform"
+    else:
+        resident = f"Resident memory: {report['rss'] / MB:.1f} MB" + (
+            f" (growing {report['rss_growth_mb_per_hour']:+.1f} MB/hour)"
+            if report.get('rss_growth_mb_per_hour') is not None else "")
+    lines = [
+        resident,
+        f"  Gallery:            {report['gallery'] / MB:8.2f} MB  "
+        f"({report['gallery_students']} students, {report['gallery_templates']} templates)",
+        f"  Recent attendance:  {report['recent_attendance'] / MB:8.2f} MB  "
+        f"({report['recent_attendance_entries']} entries)",
+        f"  Caches:             {report['caches'] / MB:8.2f} MB",
+        f"  Event queues:       {report['event_queues'] / MB:8.2f} MB  ({report['event_queue_entries']} events)",
+        f"  Detector weights:   {report['detector_weights'] / MB:8.2f} MB",
+        f"  Recognizer weights: {report['recognizer_weights'] / MB:8.2f} MB",
+    ]
+    if report['runtime_and_other'] is not None:
+        lines.append(f"  Runtimes and other: {report['runtime_and_other'] / MB:8.2f} MB")
+    if 'traced' in report:
+        lines.append(f"  Traced by tracemalloc: {report['traced'] / MB:.2f} MB")
+    if report.get('evictions'):
+        lines.append("  Evictions: " + ", ".join(f"{name} {count}" for name, count in report['evictions'].items()))
+    if report.get('top_growth'):
+        lines.append("  Top growth sites:")
+        for site, size, blocks in report['top_growth']:
+            lines.append(f"    {size / 1024:+10.1f} KiB {blocks:+7d} blocks  {site}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory footprint and leak checks for the recognition loop")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('report', help="Load the system and print its memory footprint")
+
+    leak_parser = subparsers.add_parser('leak-check', help="Replay a synthetic classroom under tracemalloc")
+    leak_parser.add_argument('--faces', type=int, default=5)
+    leak_parser.add_argument('--frames', type=int, default=1000)
+    leak_parser.add_argument('--interval', type=float, default=10.0, help="Seconds between reports")
+    leak_parser.add_argument('--top', type=int, default=10)
+    leak_parser.add_argument('--skip-models', action='store_true',
+                             help="Do not run MTCNN/FaceNet on the replayed frames")
+
+    args = parser.parse_args()
+
+    if args.command == 'report':
+        from face_recognition_system import FaceRecognitionSystem
+        monitor = MemoryMonitor()
+        print(format_report(monitor.check(FaceRecognitionSystem(memory_monitor=monitor))))
+    else:
+        from replay import run_synthetic, print_report
+        monitor = MemoryMonitor(interval=args.interval, leak_check=True, top=args.top)
+        # Loop a short clip so the replayed frames themselves stay small
+        clip = min(args.frames, 50)
+        report = run_synthetic(args.faces, frames=clip, loops=-(-args.frames // clip),
+                               run_models=not args.skip_models, memory_monitor=monitor)
+        print_report(f"Leak check: {args.faces} faces, {args.frames} frames", report)
+        print(format_report(report['memory']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import numpy as np
+from gallery import FaceGallery, normalize_rows
+
+
+def learn_student_offset(templates, base_threshold=0.5, spread=2.0, max_shift=0.1):
+    """Per-student shift of the similarity threshold from the student's enrollment templates.
+
+    Each template is scored against the centroid of the other templates
+    (leave-one-out). Students whose captures agree closely get a stricter
+    threshold, students with a lot of pose or lighting variation a looser
+    one. The result is an offset within max_shift of zero, added to
+    whatever base threshold the matcher uses.
+    """
+    templates = normalize_rows(templates)
+    count = templates.shape[0]
+    if count < 3:
+        return 0.0
+
+    total = templates.sum(axis=0)
+    others = normalize_rows(total[None, :] - templates)
+    leave_one_out = (templates * others).sum(axis=1)
+
+    learned = leave_one_out.mean() - spread * leave_one_out.std()
+    return float(np.clip(learned - base_threshold, -max_shift, max_shift))
+
+
+class OpenSetMatcher:
+    """Open-set matching with per-student thresholds and a top-1/top-2 margin"""
+
+    def __init__(self, threshold=0.5, margin=0.08, k=2, shortlist=8):
+        # Minimum cosine similarity to accept a match
+        self.threshold = threshold
+        # Minimum gap between the best and second-best student
+        self.margin = margin
+        self.k = k
+        self.gallery = FaceGallery(shortlist)
+        # Per-student shifts of threshold, so changing it moves every student
+        self.offsets = np.zeros(0, dtype=np.float32)
+
+    def fit(self, student_templates, offsets=None):
+        """Index the gallery; one template array (or vector) and threshold offset (or None) per student"""
+        self.gallery.build(student_templates)
+        if len(student_templates) == 0:
+            self.offsets = np.zeros(0, dtype=np.float32)
+            return self
+
+        if offsets is None:
+            offsets = [None] * len(student_templates)
+        self.offsets = np.array([0.0 if offset is None else offset for offset in offsets], dtype=np.float32)
+        return self
+
+    def match(self, queries):
+        """Match a batch of encodings.
+
+        Returns (indices, scores, margins): indices holds the student index or
+        -1 when rejected, scores the best template similarity, margins the gap
+        to the runner-up student.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        num_queries = len(queries)
+        if num_queries == 0 or len(self.gallery) == 0:
+            return (np.full(num_queries, -1), np.zeros(num_queries, dtype=np.float32),
+                    np.zeros(num_queries, dtype=np.float32))
+
+        indices, scores = self.gallery.match(queries.reshape(num_queries, -1), self.k)
+        return self.decide(indices, scores)
+
+    def decide(self, indices, scores):
+        """Apply thresholds and the margin test to sorted top-k results"""
+        best = indices[:, 0]
+        best_scores = scores[:, 0]
+        if scores.shape[1] > 1:
+            margins = best_scores - scores[:, 1]
+        else:
+            # A single enrolled student has no runner-up to compete with
+            margins = np.full(len(best), np.inf, dtype=np.float32)
+
+        accepted = (best_scores >= self.threshold + self.offsets[best]) & (margins >= self.margin)
+        return np.where(accepted, best, -1), best_scores, margins
@@ -0,0 +1,66 @@
+import cv2
+from camera_config import CameraConfig
+
+
+def box_iou(box_a, box_b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    intersection = inter_w * inter_h
+    return intersection / float(aw * ah + bw * bh - intersection)
+
+
+class RegionDetector:
+    """Run MTCNN on downscaled regions of interest and map results to full resolution"""
+
+    def __init__(self, mtcnn, config=None):
+        self.mtcnn = mtcnn
+        self.config = config if config is not None else CameraConfig()
+
+    def detect_faces(self, frame):
+        """Detect faces, returning MTCNN-style dicts in full-frame coordinates"""
+        height, width = frame.shape[:2]
+        scale = self.config.detection_scale
+
+        # Prune the image pyramid to faces that can actually occur in the room
+        self.mtcnn.min_face_size = self.config.detection_min_face_size(width)
+
+        faces = []
+        for left, top, region_w, region_h in self.config.pixel_rois(width, height):
+            region = frame[top:top+region_h, left:left+region_w]
+            if scale != 1.0:
+                region = cv2.resize(region, None, fx=scale, fy=scale,
+                                    interpolation=cv2.INTER_AREA)
+
+            for face in self.mtcnn.detect_faces(region):
+                faces.append(self.to_frame_coordinates(face, left, top, scale))
+
+        if len(self.config.rois) > 1:
+            faces = self.merge_overlapping(faces)
+        return faces
+
+    @staticmethod
+    def to_frame_coordinates(face, left, top, scale):
+        """Map a detection from a scaled region back onto the full frame"""
+        x, y, w, h = face['box']
+        mapped = dict(face)
+        mapped['box'] = [int(round(x / scale)) + left, int(round(y / scale)) + top,
+                         int(round(w / scale)), int(round(h / scale))]
+        mapped['keypoints'] = {
+            name: (px / scale + left, py / scale + top)
+            for name, (px, py) in face['keypoints'].items()
+        }
+        return mapped
+
+    @staticmethod
+    def merge_overlapping(faces, iou_threshold=0.5):
+        """Drop duplicate detections of the same face from overlapping regions"""
+        kept = []
+        for face in sorted(faces, key=lambda f: f['confidence'], reverse=True):
+            if all(box_iou(face['box'], other['box']) < iou_threshold for other in kept):
+                kept.append(face)
+        return kept
@@ -0,0 +1,395 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import cv2
+import numpy as np
+from camera_config import CameraConfig
+from database import StudentDatabase
+from embedding_format import encode_embedding
+from face_recognition_system import FaceRecognitionSystem
+from frame_governor import FrameRateGovernor
+from gallery import synthetic_gallery, synthetic_samples
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Faces in the room for each named scenario
+SCENARIOS = {
+    'empty': 0,
+    'faces-5': 5,
+    'faces-40': 40,
+}
+
+
+class ReplaySource:
+    """Stand-in for cv2.VideoCapture that replays recorded or synthetic frames.
+
+    source is a video file, a directory of images or a list of frames. With
+    fps=None frames are returned as fast as they are read; otherwise they
+    are paced like a live camera, and frames that went by while the caller
+    was busy are dropped, as with a one-frame capture buffer. Once the
+    sequence is exhausted read() fails and isOpened() turns False.
+    """
+
+    def __init__(self, source, fps=None, loops=1):
+        self.fps = fps
+        self.loops = loops
+        self.capture = None
+        self.frames = None
+        if isinstance(source, str) and os.path.isdir(source):
+            self.frames = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                           if name.lower().endswith(IMAGE_EXTENSIONS)]
+        elif isinstance(source, str):
+            self.capture = cv2.VideoCapture(source)
+            if not self.capture.isOpened():
+                raise ValueError(f"Cannot open video {source}")
+        else:
+            self.frames = list(source)
+
+        self.index = 0
+        self.loop = 0
+        self.dropped = 0
+        self.opened = True
+        self.start_time = None
+        # perf_counter time at which the last returned frame was read
+        self.last_read_time = None
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        # Capture properties such as the buffer size do not apply to a replay
+        return False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps or 0.0
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.index
+        return 0.0
+
+    def _next_frame(self):
+        """Next frame of the sequence, rewinding for further loops"""
+        while self.loop < self.loops:
+            if self.frames is not None:
+                if self.index < len(self.frames) * (self.loop + 1):
+                    frame = self.frames[self.index % len(self.frames)]
+                    self.index += 1
+                    return cv2.imread(frame) if isinstance(frame, str) else frame.copy()
+            else:
+                ret, frame = self.capture.read()
+                if ret:
+                    self.index += 1
+                    return frame
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.loop += 1
+        return None
+
+    def read(self):
+        if not self.opened:
+            return False, None
+
+        now = time.perf_counter()
+        if self.start_time is None:
+            self.start_time = now
+
+        if self.fps:
+            # Skip frames the camera would already have overwritten, then
+            # wait until the next one is due
+            due = int((now - self.start_time) * self.fps)
+            while self.index < due and self._next_frame() is not None:
+                self.dropped += 1
+            wait = self.start_time + self.index / self.fps - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+        frame = self._next_frame()
+        if frame is None:
+            self.release()
+            return False, None
+        self.last_read_time = time.perf_counter()
+        return True, frame
+
+    def release(self):
+        self.opened = False
+        if self.capture is not None:
+            self.capture.release()
+
+
+def face_at(x, y, size, student):
+    """MTCNN-style detection for a face whose box starts at (x, y)"""
+    return {
+        'box': [int(x), int(y), int(size), int(size * 1.2)],
+        'confidence': 0.99,
+        'keypoints': {
+            'left_eye': (x + 0.3 * size, y + 0.4 * size),
+            'right_eye': (x + 0.7 * size, y + 0.4 * size),
+            'nose': (x + 0.5 * size, y + 0.6 * size),
+            'mouth_left': (x + 0.35 * size, y + 0.85 * size),
+            'mouth_right': (x + 0.65 * size, y + 0.85 * size)
+        },
+        # Index into the synthetic identities, used in place of a real embedding
+        'student': student
+    }
+
+
+def synthetic_scenario(students, frames=100, width=1280, height=720, seed=0):
+    """Render a classroom with the given synthetic students seated in a grid.
+
+    Returns (frames, faces_per_frame): every face sways a little from frame
+    to frame so the motion detector sees a live room.
+    """
+    rng = np.random.default_rng(seed)
+    background = np.full((height, width, 3), 90, dtype=np.uint8)
+    background += rng.integers(0, 20, size=background.shape, dtype=np.uint8)
+
+    columns = max(1, int(np.ceil(np.sqrt(len(students) * width / float(height)))))
+    rows = max(1, int(np.ceil(len(students) / float(columns))))
+    cell_w, cell_h = width / float(columns), height / float(rows)
+    size = int(min(cell_w, cell_h / 1.2) * 0.6)
+    phases = rng.uniform(0, 2 * np.pi, size=len(students))
+
+    rendered, detections = [], []
+    for index in range(frames):
+        frame = background.copy()
+        faces = []
+        for seat, student in enumerate(students):
+            sway = 0.1 * size * np.sin(index / 5.0 + phases[seat])
+            x = (seat % columns) * cell_w + (cell_w - size) / 2 + sway
+            y = (seat // columns) * cell_h + (cell_h - size * 1.2) / 2
+            face = face_at(x, y, size, student)
+            center = (int(x + size / 2), int(y + size * 0.6))
+            cv2.ellipse(frame, center, (size // 2, int(size * 0.6)), 0, 0, 360, (140, 170, 210), -1)
+            for name in ('left_eye', 'right_eye'):
+                cv2.circle(frame, tuple(int(v) for v in face['keypoints'][name]), max(2, size // 12),
+                           (40, 40, 40), -1)
+            cv2.line(frame, tuple(int(v) for v in face['keypoints']['mouth_left']),
+                     tuple(int(v) for v in face['keypoints']['mouth_right']), (60, 60, 150), 2)
+            faces.append(face)
+        rendered.append(frame)
+        detections.append(faces)
+    return rendered, detections
+
+
+class ScriptedDetector:
+    """Return the scenario's known detections for each replayed frame.
+
+    With a real detector attached it is still run on every frame so its
+    cost is measured, but its output is discarded.
+    """
+
+    def __init__(self, source, detections, detector=None):
+        self.source = source
+        self.detections = detections
+        self.detector = detector
+
+    def detect_faces(self, frame):
+        if self.detector is not None:
+            self.detector.detect_faces(frame)
+        return [dict(face) for face in self.detections[(self.source.index - 1) % len(self.detections)]]
+
+
+class SyntheticRecognitionSystem(FaceRecognitionSystem):
+    """FaceRecognitionSystem whose embeddings come from synthetic identities.
+
+    With run_models the aligner and FaceNet still run on every face so the
+    timing includes them; their output is replaced by a noisy sample of
+    the face's synthetic identity.
+    """
+
+    def __init__(self, identities, pose_offsets, run_models=True, **kwargs):
+        self.identities = identities
+        self.pose_offsets = pose_offsets
+        self.run_models = run_models
+        self.samples = 0
+        super().__init__(**kwargs)
+
+    def embed_faces(self, frame, faces):
+        if not faces or 'student' not in faces[0]:
+            return super().embed_faces(frame, faces)
+        if self.run_models:
+            super().embed_faces(frame, faces)
+        self.samples += 1
+        students = [face['student'] for face in faces]
+        return list(synthetic_samples(self.identities, self.pose_offsets, students, seed=100 + self.samples))
+
+
+def enroll_synthetic_gallery(db, identities, pose_offsets, students):
+    """Enroll the first students synthetic identities with one template per pose"""
+    templates = np.stack([
+        synthetic_samples(identities[:students], pose_offsets[:students, [pose]], np.arange(students),
+                          seed=10 + pose)
+        for pose in range(pose_offsets.shape[1])
+    ], axis=1)
+    for index in range(students):
+        db.add_student(f"Student {index}", f"SYN{index:05d}", encode_embedding(templates[index].mean(axis=0)),
+                       templates=[encode_embedding(template) for template in templates[index]])
+
+
+def latency_percentiles(latencies):
+    """p50/p90/p99/max of a list of seconds, in milliseconds"""
+    if not latencies:
+        return {'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'max': 0.0}
+    values = np.array(latencies) * 1000
+    return {
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max())
+    }
+
+
+def attendance_accuracy(marked, expected):
+    """Precision and recall of the marked enrollments against the expected ones"""
+    marked, expected = set(marked), set(expected)
+    correct = len(marked & expected)
+    return {
+        'expected': len(expected),
+        'marked': len(marked),
+        'correct': correct,
+        'false_marks': len(marked - expected),
+        'precision': correct / len(marked) if marked else 1.0,
+        'recall': correct / len(expected) if expected else 1.0
+    }
+
+
+def run_replay(system, source, governed=False, max_frames=None):
+    """Drive detect_and_recognize headless from source and time every processed frame"""
+    latencies = []
+
+    def on_results(results):
+        latencies.append(time.perf_counter() - source.last_read_time)
+
+    if not governed:
+        # Detect on every frame without pacing, so the run measures capacity
+        system.governor = FrameRateGovernor(active_fps=float('inf'), idle_after=float('inf'),
+                                            cpu_budget=float('inf'))
+
+    start = time.perf_counter()
+    system.detect_and_recognize(capture=source, headless=True, max_frames=max_frames,
+                                on_results=on_results)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'frames': source.index - source.dropped,
+        'processed': len(latencies),
+        'dropped': source.dropped,
+        'seconds': elapsed,
+        'fps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'latency_ms': latency_percentiles(latencies)
+    }
+
+
+def run_synthetic(scenario_faces, gallery_size=200, frames=100, loops=1, fps=None, strangers=0.1,
+                  run_models=True, governed=False, intrinsic_dimension=128, seed=0, memory_monitor=None):
+    """Replay a synthetic classroom against a temporary database and report performance.
+
+    The default intrinsic_dimension spreads identities about as far apart
+    as FaceNet embeddings of different people; lower it for a harder gallery.
+    """
+    rng = np.random.default_rng(seed)
+    stranger_count = int(round(scenario_faces * strangers))
+    identities, pose_offsets = synthetic_gallery(gallery_size + stranger_count,
+                                                 intrinsic_dimension=intrinsic_dimension, seed=seed)
+    present = list(rng.choice(gallery_size, size=scenario_faces - stranger_count, replace=False))
+    present += list(range(gallery_size, gallery_size + stranger_count))
+    rendered, detections = synthetic_scenario(present, frames, seed=seed)
+
+    workdir = tempfile.mkdtemp(prefix="replay_")
+    try:
+        db = StudentDatabase(os.path.join(workdir, "replay.db"), os.path.join(workdir, "events"))
+        enroll_synthetic_gallery(db, identities, pose_offsets, gallery_size)
+
+        system = SyntheticRecognitionSystem(identities, pose_offsets, run_models, camera_config=CameraConfig(),
+                                            db=db, memory_monitor=memory_monitor)
+        source = ReplaySource(rendered, fps=fps, loops=loops)
+        system.detector = ScriptedDetector(source, detections, system.detector if run_models else None)
+        report = run_replay(system, source, governed)
+
+        marked = [record[3] for record in db.get_attendance_records()]
+        expected = [f"SYN{student:05d}" for student in present if student < gallery_size]
+        report['attendance'] = attendance_accuracy(marked, expected)
+        if memory_monitor is not None:
+            report['memory'] = memory_monitor.check(system)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def print_report(title, report):
+    latency = report['latency_ms']
+    print(f"\n{title}")
+    print(f"  Frames: {report['frames']} read, {report['processed']} processed, {report['dropped']} dropped")
+    print(f"  Throughput: {report['fps']:.2f} FPS over {report['seconds']:.2f}s")
+    print(f"  Latency (ms): p50 {latency['p50']:.1f}  p90 {latency['p90']:.1f}  "
+          f"p99 {latency['p99']:.1f}  max {latency['max']:.1f}")
+    if 'attendance' in report:
+        accuracy = report['attendance']
+        print(f"  Attendance: {accuracy['correct']}/{accuracy['expected']} expected students marked, "
+              f"{accuracy['false_marks']} false marks, precision {accuracy['precision']:.3f}, "
+              f"recall {accuracy['recall']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded or synthetic frames through the recognition loop")
+    parser.add_argument('--fps', type=float, help="Replay rate (default: as fast as possible)")
+    parser.add_argument('--governed', action='store_true',
+                        help="Keep the frame-rate governor instead of detecting on every frame")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    synthetic_parser = subparsers.add_parser('synthetic', help="Synthetic classroom scenarios")
+    synthetic_parser.add_argument('--scenario', choices=sorted(SCENARIOS) + ['all'], default='all')
+    synthetic_parser.add_argument('--faces', type=int, help="Custom number of faces in the room")
+    synthetic_parser.add_argument('--gallery', type=int, default=200, help="Enrolled synthetic students")
+    synthetic_parser.add_argument('--frames', type=int, default=100)
+    synthetic_parser.add_argument('--strangers', type=float, default=0.1,
+                                  help="Fraction of faces that are not enrolled")
+    synthetic_parser.add_argument('--intrinsic-dimension', type=int, default=128,
+                                  help="Lower values make synthetic students harder to tell apart")
+    synthetic_parser.add_argument('--skip-models', action='store_true',
+                                  help="Do not run MTCNN/FaceNet, measure only the rest of the pipeline")
+
+    recorded_parser = subparsers.add_parser('recorded', help="A recorded video or image directory")
+    recorded_parser.add_argument('source', help="Video file or directory of frames")
+    recorded_parser.add_argument('--db', default="student_database.db")
+    recorded_parser.add_argument('--loops', type=int, default=1)
+    recorded_parser.add_argument('--expected', help="File with the enrollment numbers present, one per line")
+
+    args = parser.parse_args()
+
+    if args.command == 'synthetic':
+        if args.faces is not None:
+            scenarios = [(f"faces-{args.faces}", args.faces)]
+        elif args.scenario == 'all':
+            scenarios = sorted(SCENARIOS.items(), key=lambda item: item[1])
+        else:
+            scenarios = [(args.scenario, SCENARIOS[args.scenario])]
+
+        for name, faces in scenarios:
+            report = run_synthetic(faces, args.gallery, args.frames, 1, args.fps, args.strangers,
+                                   not args.skip_models, args.governed, args.intrinsic_dimension)
+            print_report(f"Scenario {name}: {faces} faces, {args.gallery} enrolled", report)
+    else:
+        # Work on a copy so replayed attendance does not touch the live database
+        workdir = tempfile.mkdtemp(prefix="replay_")
+        try:
+            db_copy = os.path.join(workdir, "replay.db")
+            shutil.copyfile(args.db, db_copy)
+            db = StudentDatabase(db_copy, os.path.join(workdir, "events"))
+            db.delete_all_attendance()
+            system = FaceRecognitionSystem(db=db)
+            report = run_replay(system, ReplaySource(args.source, args.fps, args.loops), args.governed)
+            marked = [record[3] for record in db.get_attendance_records()]
+            if args.expected:
+                with open(args.expected) as f:
+                    expected = [line.strip() for line in f if line.strip()]
+                report['attendance'] = attendance_accuracy(marked, expected)
+            print_report(f"Replay of {args.source}", report)
+            print(f"  Marked: {', '.join(sorted(set(marked))) or 'nobody'}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from database import StudentDatabase
+
+CACHE_VERSION = 1
+UNASSIGNED_COURSE = "Unassigned"
+SHEET_COLUMNS = ['Enrollment_Number', 'Name', 'First_Seen', 'Last_Seen', 'Marks', 'Minutes_Present']
+# Stale sheets with fewer student rows than this in total are built inline.
+# Spawning the pool takes ~1s and a row costs ~25us to build but ~2us to
+# ship to a worker, so four workers only break even around 50k rows
+POOL_MIN_ROWS = 50000
+# Characters Excel does not allow in sheet names
+INVALID_SHEET_CHARACTERS = '[]:*?/\\'
+
+
+def build_sheet(job):
+    """Turn one (course, day) group of per-student aggregates into sheet rows.
+
+    Runs in the worker pool, so it only takes and returns plain data.
+    """
+    course, day, students = job
+    rows = []
+    for _, name, enrollment, first_seen, last_seen, marks in students:
+        first = datetime.strptime(first_seen[:19], "%Y-%m-%d %H:%M:%S")
+        last = datetime.strptime(last_seen[:19], "%Y-%m-%d %H:%M:%S")
+        rows.append([enrollment, name, first.strftime("%H:%M:%S"), last.strftime("%H:%M:%S"), marks,
+                     round((last - first).total_seconds() / 60.0, 1)])
+    rows.sort(key=lambda row: ((row[1] or '').lower(), row[0] or ''))
+    return course, day, rows
+
+
+def sheet_title(course, day, used):
+    """Unique Excel-safe sheet name such as 'CS101 10-14' (31 characters at most)"""
+    for character in INVALID_SHEET_CHARACTERS:
+        course = course.replace(character, '-')
+    title = f"{course[:25]} {day[5:]}"
+    suffix = 2
+    while title.lower() in used:
+        tag = f"~{suffix}"
+        title = f"{course[:25 - len(tag)]}{tag} {day[5:]}"
+        suffix += 1
+    used.add(title.lower())
+    return title
+
+
+class ReportGenerator:
+    """Weekly attendance workbook with one sheet per course and day plus a summary pivot.
+
+    Attendance is read in one SQL pass grouped by course, day and student;
+    sheets are built in a process pool and streamed into a write-only
+    workbook. Each (course, day) sheet is cached under cache_dir with a
+    fingerprint of its attendance, so regenerating a report only rebuilds
+    the days that received new marks.
+    """
+
+    def __init__(self, db=None, cache_dir="report_cache", workers=None):
+        self.db = db if db is not None else StudentDatabase()
+        self.cache_dir = cache_dir
+        self.workers = workers if workers is not None else min(4, os.cpu_count() or 1)
+
+    @staticmethod
+    def week_start(date=None):
+        """Monday of the week containing date (default today) as YYYY-MM-DD"""
+        day = datetime.strptime(date, "%Y-%m-%d") if date else datetime.now()
+        return (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d")
+
+    def _event_rows(self, start, end):
+        """Event-log attendance in the range, grouped like the SQL pass"""
+        courses = self.db.get_student_courses()
+        grouped = {}
+        for _, student_id, name, enrollment, timestamp in self.db.get_event_records():
+            if start <= timestamp < end:
+                key = (courses.get(student_id), timestamp[:10])
+                grouped.setdefault(key, []).append(
+                    (student_id, name, enrollment, timestamp, timestamp, 1))
+        return grouped
+
+    def _cache_path(self, course, day):
+        digest = hashlib.sha1(str(course).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{day}_{digest}.json")
+
+    def _load_cache(self, course, day, fingerprint):
+        """Cached sheet rows if the fingerprint still matches, else None"""
+        path = self._cache_path(course, day)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get('version') != CACHE_VERSION or cached.get('fingerprint') != fingerprint:
+            return None
+        return cached['rows']
+
+    def _store_cache(self, course, day, fingerprint, rows):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(course, day)
+        temporary = path + ".tmp"
+        with open(temporary, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'course': course, 'day': day,
+                       'fingerprint': fingerprint, 'rows': rows}, f)
+        os.replace(temporary, path)
+
+    def _built_sheets(self, jobs):
+        """Build sheets in job order, in a worker pool when there are enough rows"""
+        if self.workers <= 1 or sum(len(job[2]) for job in jobs) < POOL_MIN_ROWS:
+            for job in jobs:
+                yield build_sheet(job)
+            return
+
+        # Spawned workers do not inherit the GUI's threads or loaded models
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(self.workers, mp_context=context) as executor:
+            for result in executor.map(build_sheet, jobs, chunksize=max(1, len(jobs) // (self.workers * 4))):
+                yield result
+
+    def generate_weekly_report(self, start_date=None, days=7, filename=None):
+        """Write the report workbook and return statistics, or None without attendance"""
+        from openpyxl import Workbook
+
+        started = time.perf_counter()
+        start = self.week_start(start_date)
+        day_list = [(datetime.strptime(start, "%Y-%m-%d") + timedelta(days=offset)).strftime("%Y-%m-%d")
+                    for offset in range(days)]
+        end = (datetime.strptime(start, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+        # Fingerprint every (course, day); the event log is hashed in
+        fingerprints = {key: list(value) for key, value in self.db.get_course_day_fingerprints(start, end).items()}
+        events = self._event_rows(start, end)
+        for key, rows in events.items():
+            digest = hashlib.sha1(repr(sorted((row[0], row[3]) for row in rows)).encode('utf-8')).hexdigest()
+            fingerprints.setdefault(key, [0, 0, None]).append(digest)
+
+        if not fingerprints:
+            print(f"No attendance records found from {start} to {day_list[-1]}")
+            return None
+
+        keys = sorted(fingerprints, key=lambda key: (key[0] or UNASSIGNED_COURSE, key[1]))
+        cached = {}
+        for course, day in keys:
+            rows = self._load_cache(course, day, fingerprints[(course, day)])
+            if rows is not None:
+                cached[(course, day)] = rows
+        stale = [key for key in keys if key not in cached]
+
+        # One grouped pass over the attendance of the days that changed
+        groups = {key: [] for key in stale}
+        stale_days = set(day for _, day in stale)
+        for course, day, *student in self.db.get_course_day_attendance(start, end, stale_days):
+            if (course, day) in groups:
+                groups[(course, day)].append(tuple(student))
+        for key in stale:
+            merged = {}
+            for student_id, name, enrollment, first_seen, last_seen, marks in groups[key] + events.get(key, []):
+                if student_id in merged:
+                    _, _, _, first, last, count = merged[student_id]
+                    merged[student_id] = (student_id, name, enrollment, min(first, first_seen),
+                                          max(last, last_seen), count + marks)
+                else:
+                    merged[student_id] = (student_id, name, enrollment, first_seen, last_seen, marks)
+            groups[key] = list(merged.values())
+
+        workbook = Workbook(write_only=True)
+        built = self._built_sheets([(course, day, groups[(course, day)]) for course, day in stale])
+        used_titles = {'summary'}
+        present = {}
+        for course, day in keys:
+            if (course, day) in cached:
+                rows = cached.pop((course, day))
+            else:
+                _, _, rows = next(built)
+                self._store_cache(course, day, fingerprints[(course, day)], rows)
+
+            label = course or UNASSIGNED_COURSE
+            worksheet = workbook.create_sheet(sheet_title(label, day, used_titles))
+            worksheet.append(SHEET_COLUMNS)
+            for row in rows:
+                worksheet.append(row)
+            present.setdefault(label, {})[day] = len(rows)
+
+        # Summary pivot: students present per course and day
+        summary = workbook.create_sheet("Summary", 0)
+        summary.append(['Course'] + day_list + ['Total'])
+        for label in sorted(present):
+            counts = [present[label].get(day, 0) for day in day_list]
+            summary.append([label] + counts + [sum(counts)])
+        totals = [sum(present[label].get(day, 0) for label in present) for day in day_list]
+        summary.append(['Total'] + totals + [sum(totals)])
+
+        if filename is None:
+            filename = f"weekly_report_{start}.xlsx"
+        workbook.save(filename)
+
+        return {
+            'path': filename,
+            'sheets': len(keys),
+            'rebuilt': len(stale),
+            'cached': len(keys) - len(stale),
+            'seconds': time.perf_counter() - started
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-course, per-day attendance reports")
+    parser.add_argument('--db', default="student_database.db")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    weekly_parser = subparsers.add_parser('weekly', help="Workbook with one sheet per course and day")
+    weekly_parser.add_argument('--start', help="Any date in the week to report (default: this week)")
+    weekly_parser.add_argument('--days', type=int, default=7)
+    weekly_parser.add_argument('--output')
+    weekly_parser.add_argument('--workers', type=int)
+    weekly_parser.add_argument('--cache-dir', default="report_cache")
+
+    courses_parser = subparsers.add_parser('assign-courses',
+                                           help="Set courses from a CSV of enrollment_number,course rows")
+    courses_parser.add_argument('path')
+
+    args = parser.parse_args()
+    db = StudentDatabase(args.db)
+
+    if args.command == 'weekly':
+        generator = ReportGenerator(db, args.cache_dir, args.workers)
+        stats = generator.generate_weekly_report(args.start, args.days, args.output)
+        if stats:
+            print(f"Weekly report written to {stats['path']}: {stats['sheets']} sheets "
+                  f"({stats['rebuilt']} rebuilt, {stats['cached']} cached) in {stats['seconds']:.2f}s")
+    elif args.command == 'assign-courses':
+        with open(args.path, newline='') as f:
+            rows = [(row[0].strip(), row[1].strip()) for row in csv.reader(f)
+                    if len(row) >= 2 and row[0].strip() and row[0].strip() != 'enrollment_number']
+        updated = db.set_student_courses(rows)
+        print(f"Assigned courses to {updated} of {len(rows)} students")
+
+
+if __name__ == "__main__":
+    main()
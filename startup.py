@@ -0,0 +1,106 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupManager:
+    """Load the vision models in the background and time each startup phase.
+
+    Nothing here imports TensorFlow, PyTorch or the face models at module
+    level; they are only pulled in by the background loader, so export and
+    admin actions never pay for them.
+    """
+
+    def __init__(self, system_options=None):
+        # Keyword arguments for FaceRecognitionSystem
+        self.system_options = dict(system_options or {})
+        self.started_at = time.perf_counter()
+        self.timings = []
+        self.error = None
+        self.face_system = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block and record it under name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """Record the duration of a startup phase"""
+        with self._lock:
+            self.timings.append((name, seconds))
+
+    def mark(self, name):
+        """Record the time elapsed since the manager was created"""
+        self.record(name, time.perf_counter() - self.started_at)
+
+    def start_background_load(self):
+        """Start loading the models on a daemon thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._load, daemon=True)
+        self._thread.start()
+
+    def reset(self):
+        """Forget a failed load so start_background_load tries again"""
+        with self._lock:
+            if self._thread is not None and not self._ready.is_set():
+                return
+            self._thread = None
+            self._ready = threading.Event()
+            self.error = None
+            self.face_system = None
+
+    def _load(self):
+        try:
+            with self.phase("import vision libraries"):
+                from face_recognition_system import FaceRecognitionSystem
+
+            face_system = FaceRecognitionSystem(**self.system_options)
+            for name, seconds in face_system.load_timings:
+                self.record(name, seconds)
+
+            with self.phase("warm-up inference"):
+                face_system.warm_up()
+
+            self.face_system = face_system
+            self.mark("models ready")
+        except Exception as e:
+            self.error = e
+        finally:
+            self._ready.set()
+
+    @property
+    def loading(self):
+        """True while the background loader is running"""
+        return self._thread is not None and not self._ready.is_set()
+
+    @property
+    def ready(self):
+        """True once the models are loaded and warmed up"""
+        return self._ready.is_set() and self.error is None
+
+    def get_face_system(self, timeout=None):
+        """Return the loaded system, starting and waiting for the loader if needed"""
+        self.start_background_load()
+        if not self._ready.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.face_system
+
+    def report(self):
+        """Per-phase startup time breakdown"""
+        with self._lock:
+            timings = list(self.timings)
+        lines = ["Startup time breakdown:"]
+        for name, seconds in timings:
+            lines.append(f"  {name:<26}{seconds:>8.2f}s")
+        return "\n".join(lines)